@@ -1,25 +1,33 @@
 import pygame as pg
 
-pg.init()
-
 
 class BasicMarker:
 
+    # The default font is only created when it's needed, as pygame's font module must have been initialised first, and
+    #   looking up a system font can be slow.
+    # The marker's colour and text never change, so its surfaces are drawn once here, and then just blitted each frame.
     def __init__(self, rect,
                  colour=pg.Color('blue'),
                  text='default',
-                 font=pg.font.SysFont("Arial", 16),
+                 font=None,
                  font_colour=pg.Color('white')):
+        if font is None:
+            font = pg.font.SysFont("Arial", 16)
         self.rect = pg.Rect(rect)
         self.image = pg.Surface(self.rect.size).convert()
         self.colour = colour
+        self.image.fill(self.colour)
         self.font = font
         self.font_colour = font_colour
         self.text = self.font.render(text, True, self.font_colour)
         self.text_rect = self.text.get_rect(center=self.rect.center)
 
+    @property
+    def dirty_rect(self):
+        # Everything the marker draws over, as the text can be wider than the marker itself.
+        return self.rect.union(self.text_rect)
+
     def draw(self, surf):
-        self.image.fill(self.colour)
         surf.blit(self.image, self.rect)
         surf.blit(self.text, self.text_rect)
 
@@ -1,74 +1,167 @@
 # NL: This is the main file that provides a nice interface to gthoi_solver.py.
 # See readme.md for detailed usage instructions.
 
-import pygame as pg
+# Note that pygame (and anything else that's only needed for the GUI) isn't imported until after the --headless option
+#   has been dealt with, so that a headless solve never pays for it.
+
 import numpy as np
 import json
 import argparse
+import os
+import time
 
-from basic_marker import BasicMarker
-from gthoi_solver import gthoi_solver
+import gthoi_profiling
+from gthoi_heatmap import HeatmapRenderer
+from gthoi_geometry import (MARKER_NAMES, button_distance, config_extended_model, config_image_coords,
+                            config_marker_centres, config_real_to_pixel_dist_ratio, equilibrium, image_to_pixel,
+                            marker_centre, pixel_to_image, solver_inputs, strap_pixel_path)
+from gthoi_solver import SOLVER_BACKENDS
+from gthoi_strap_length import strap_length_for_angle
+from gthoi_table import DEFAULT_TABLE_PATH, EquilibriumTable
+from gthoi_uncertainty import DEFAULT_UNCERTAINTIES, UNCERTAIN_INPUTS, equilibrium_uncertainty, uncertainty_report
+from gthoi_worker import SolveWorker, TaskWorker, range_text, solve_message
 
 
-# Workaround for NumPy's annoying deprecation:
-def cross2d(x, y):
-    return x[..., 0] * y[..., 1] - x[..., 1] * y[..., 0]
+# The main loop waits as necessary to run at no more than this many frames per second. In live mode, the system is
+#   solved at most once per frame, however many mouse motion events arrive in between.
+MAX_FRAME_RATE = 60
 
+# The width in pixels of the strap as drawn in live mode.
+STRAP_LINE_WIDTH = 3
+
+# With --frame-times, the frame timings in the window caption are updated once every this many frames.
+FRAME_TIMES_CAPTION_INTERVAL = 30
+
+# The factor by which the '+' and '-' keys zoom the window in and out.
+ZOOM_FACTOR = 1.25
+
+# The window can't be zoomed or resized any smaller than this many pixels along the longest side of the image.
+MIN_IMAGE_DIM = 200
+
+# 'a', 'u' and 'm' only give the free-sliding angle of the extended model (see gthoi_extended.py), so they say so when
+#   there's friction.
+FREE_SLIDING_NOTE = "(With strap friction, these are the angles the guitar settles at if the strap slides freely.)"
 
-pg.init()
 
 parser = argparse.ArgumentParser()
 parser.add_argument('config_file', nargs='?', default='config/config.json',
                     help="The name of a JSON config file containing some required initialisation parameters. This is "
                          "optional, as a default path and file has been supplied.")
+parser.add_argument('--solver-backend', choices=SOLVER_BACKENDS, default='numpy',
+                    help="The method used to solve the quartic. 'sympy' is much slower, and is kept as a reference.")
+parser.add_argument('--lookup-table', nargs='?', const=DEFAULT_TABLE_PATH, default=None, metavar='TABLE_PATH',
+                    help="Use a precomputed lookup table (see gthoi_table.py) for the solves in live mode, falling "
+                         "back to the exact solver where the table isn't accurate enough. Defaults to "
+                         f"{DEFAULT_TABLE_PATH} if no path is given.")
+parser.add_argument('--headless', action='store_true',
+                    help="Just solve the system as set up in the config file, print the result, and exit, without "
+                         "opening a window.")
+parser.add_argument('--frame-times', action='store_true',
+                    help="Show the frame rate, the longest frame and the time spent drawing in the window caption, "
+                         "and print them on exit.")
+parser.add_argument('--profile', nargs='?', const='summary', default=None, metavar='JSON_PATH',
+                    help="Time each stage of every solve, and count unstable designs and residuals close to the "
+                         "solver's tolerance (see gthoi_profiling.py). A summary is printed on exit, or, if a .json "
+                         "path is given, everything is written there instead.")
+parser.add_argument('--uncertainties', type=float, nargs=4, default=DEFAULT_UNCERTAINTIES,
+                    metavar=tuple(name.upper() for name in UNCERTAIN_INPUTS),
+                    help="The standard deviations of the position of each marker (in each of x and y) and of the strap "
+                         "length, in the units of the strap length, for the uncertainty analysis with the 'u' key (see "
+                         "gthoi_uncertainty.py).")
+parser.add_argument('--record', default=None, metavar='SESSION_PATH',
+                    help="Record the session (every mouse drag, key press and 'h' solve) to this JSON file on exit, to "
+                         "be replayed with --replay (see gthoi_session.py).")
+parser.add_argument('--replay', default=None, metavar='SESSION_PATH',
+                    help="Replay a session recorded with --record, without opening a window and as fast as possible, "
+                         "and print how long the frames, the drawing and the solves took, and whether the solves "
+                         "match the recording. The config file is ignored, in favour of the one that was recorded.")
+parser.add_argument('--replay-output', default=None, metavar='JSON_PATH',
+                    help="With --replay, also write the timings and the result of the check to this JSON file.")
 args = parser.parse_args()
+if args.record and args.replay:
+    parser.error("--record and --replay can't be used together.")
+if args.profile:
+    gthoi_profiling.enable(args.profile)
+# The table isn't read until live mode first uses it, but it has to have been built.
+lookup_table = EquilibriumTable(args.lookup_table) if args.lookup_table else None
+if lookup_table is not None and lookup_table.missing_files():
+    build_command = "python gthoi_table.py" + (f" --output {args.lookup_table}"
+                                               if args.lookup_table != DEFAULT_TABLE_PATH else "")
+    parser.error(f"--lookup-table: {' and '.join(lookup_table.missing_files())} not found. Build the table first, "
+                 f"with {build_command}")
+
+# A replay starts from the config the session was recorded with, and runs without a window, so SDL is pointed at its
+#   dummy drivers before pygame is imported.
+session = None
+if args.replay:
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    from gthoi_session import SessionReplay
+    session = SessionReplay(args.replay)
+    configs = session.configs
+else:
+    with open(args.config_file, mode="r") as config_file:
+        configs = json.load(config_file)
+
+# This is all that happens with --headless: the same solve as the 'h' key (see gthoi_worker.py), straight after loading.
+if args.headless:
+    print(solve_message(*config_marker_centres(configs), config_real_to_pixel_dist_ratio(configs),
+                        configs['init_strap_length'], args.solver_backend, *config_extended_model(configs))[0])
+    raise SystemExit
+
+import pygame as pg
+
+from basic_marker import BasicMarker
+from gthoi_image import GuitarImage
+from gthoi_render import DirtyRectRenderer, FrameTimer
+from gthoi_session import SessionRecorder, replay_summary
+
+pg.init()
+
+recorder = SessionRecorder(args.record, configs) if args.record else None
 
-with open(args.config_file, mode="r") as config_file:
-    configs = json.load(config_file)
+# The image is loaded at max_dim from the cache if it's there (see gthoi_image.py), and scaled from whatever's loaded
+#   when the window is zoomed or resized.
 max_dim = configs['max_dim']
 guitar_image_path = configs['guitar_image_path']
-gitar = pg.image.load(guitar_image_path)
+guitar_image = GuitarImage(guitar_image_path)
+gitar = guitar_image.load(max_dim)
+scaled_width, scaled_height = gitar.get_size()
+# The number of pixels along the longest side of the image as shown, which converts image coordinates to pixels.
+image_dim = max(scaled_width, scaled_height)
 
-image_dims = gitar.get_size()
-image_scale_ratio = max_dim / max(image_dims)
-scaled_width = int(image_dims[0] * image_scale_ratio)
-scaled_height = int(image_dims[1] * image_scale_ratio)
-
-screen = pg.display.set_mode((scaled_width, scaled_height))
+screen = pg.display.set_mode((scaled_width, scaled_height), pg.RESIZABLE)
 pg.display.set_caption('Get the Hang of It')
 
 gitar = gitar.convert()
-gitar = pg.transform.scale(gitar, (scaled_width, scaled_height))
 
 marker_colour = configs['marker_colour']
 marker_font = configs['marker_font']
 marker_font_colour = configs['marker_font_colour']
 marker_font_size = configs['marker_font_size']
 marker_size = configs['marker_size']
-B1_init_pixel_coords = configs['B1_init_pixel_coords']
-COM_init_pixel_coords = configs['COM_init_pixel_coords']
-B2_init_pixel_coords = configs['B2_init_pixel_coords']
-init_real_to_pixel_dist_ratio = configs['init_real_to_pixel_dist_ratio']
+# The marker positions are in image coordinates (see gthoi_geometry.py), which don't depend on the size of the window.
+#   They're only updated when a marker is moved, so that zooming in and out never makes them drift.
+marker_image_coords, init_real_to_image_dist_ratio = config_image_coords(configs)
+marker_image_coords = list(marker_image_coords)
 init_strap_length = configs['init_strap_length']
+# The extended model (see gthoi_extended.py) is only used if the config file chooses it. The shoulder radius is in the
+#   same units as the strap length, so it's converted along with it by the button-distance calibration.
+shoulder_radius, strap_friction = config_extended_model(configs)
 
 # There is a bespoke ordering to the markers: (1) B1, (2) COM, (3) B3.
 # Note that we store markers by their centres, not by their top left coords, because we want their locations to be
 #   independent of their display widths. So we have to apply offsets, as below.
-markers = [
-    BasicMarker(rect=pg.Rect(B1_init_pixel_coords[0] - marker_size/2.0, B1_init_pixel_coords[1] - marker_size/2.0,
-                             marker_size, marker_size),
-                colour=pg.Color(marker_colour), font=pg.font.SysFont(marker_font, marker_font_size),
-                font_colour=pg.Color(marker_font_colour), text='B1'),
-    BasicMarker(rect=pg.Rect(COM_init_pixel_coords[0] - marker_size/2.0, COM_init_pixel_coords[1] - marker_size/2.0,
-                             marker_size, marker_size),
-                colour=pg.Color(marker_colour), font=pg.font.SysFont(marker_font, marker_font_size),
-                font_colour=pg.Color(marker_font_colour), text='COM'),
-    BasicMarker(rect=pg.Rect(B2_init_pixel_coords[0] - marker_size/2.0, B2_init_pixel_coords[1] - marker_size/2.0,
-                             marker_size, marker_size),
-                colour=pg.Color(marker_colour), font=pg.font.SysFont(marker_font, marker_font_size),
-                font_colour=pg.Color(marker_font_colour), text='B2')
-]
+markers = []
+for name, image_coords in zip(MARKER_NAMES, marker_image_coords):
+    init_pixel_coords = image_to_pixel(image_coords, image_dim)
+    markers.append(
+        BasicMarker(rect=pg.Rect(init_pixel_coords[0] - marker_size/2.0, init_pixel_coords[1] - marker_size/2.0,
+                                 marker_size, marker_size),
+                    colour=pg.Color(marker_colour), font=pg.font.SysFont(marker_font, marker_font_size),
+                    font_colour=pg.Color(marker_font_colour), text=name))
 active_marker = None
+overlay_font = pg.font.SysFont(marker_font, marker_font_size)
 
 # The other parameter defining the system is the strap length. It's given a default value, but this can be overwritten
 #   at any time by entering any representation of a float into the keyboard and hitting Return. (Backspace will work
@@ -78,7 +171,8 @@ active_marker = None
 # There is also the question of scale, which effectively defines the units in which the user expresses the strap length
 #   (as well as all of the other distances between markers, though the user does not need to be concerned about those
 #   directly).
-real_to_pixel_dist_ratio = init_real_to_pixel_dist_ratio
+real_to_image_dist_ratio = init_real_to_image_dist_ratio
+real_to_pixel_dist_ratio = real_to_image_dist_ratio / image_dim
 strap_length = init_strap_length
 # This point may be a bit confusing, but it ultimately makes everything simpler for the user: the marker positions are
 #   represented in pixel terms, but there is a ratio maintained between distances in pixels and whatever other
@@ -87,32 +181,205 @@ strap_length = init_strap_length
 #   a straightforward method of setting this up, and the 'w' key allows the user to write these parameters out to the
 #   config file for reuse in later sessions once this has been done.
 # However, the user may want to know what to do at first when initialising these parameters manually in a new config
-#   file (e.g. for a new guitar). A simple way to start is to set init_real_to_pixel_dist_ratio to 1.0 (meaning that all
-#   measurements are in terms of pixels), and then set the strap length to something reasonable, e.g. 3 times the
-#   distance in pixels between the strap buttons. From there, the I/O tools can be used to set these values more
-#   precisely.
-# One note: because pixel coordinates are used in places, changing the "max_dim" parameter that controls the window size
-#   will invalidate other measurements, and require recalibration.
+#   file (e.g. for a new guitar). A simple way to start is to set init_real_to_image_dist_ratio to 1.0 (meaning that all
+#   measurements are in terms of the longest side of the image), and then set the strap length to something reasonable,
+#   e.g. 3 times the distance between the strap buttons in those terms. From there, the I/O tools can be used to set
+#   these values more precisely.
+# The config file keeps the marker positions and the length calibration in terms of the image rather than pixels (see
+#   gthoi_geometry.py), so changing the "max_dim" parameter that controls the window size, or zooming or resizing the
+#   window, doesn't affect them. real_to_pixel_dist_ratio is worked out from real_to_image_dist_ratio for the size the
+#   image is shown at.
 
 print()
 print("Let's find out how your guitar hangs.")
 print("Press 'd' to enter button-distance calibration mode, or 's' for strap-length entry mode.")
 print("Press 'h' to solve the system.")
+print("Press 'a' to enter a target angle, and find the strap length that gives it.")
+print("Press 'u' to find out how far the equilibrium angle could be out, given the uncertainties in the measurements.")
+print("Press 'm' to cycle through maps of the equilibrium angle for every position of B2, or of the COM.")
+print("Press 'l' to toggle live mode, which solves the system continuously and draws the strap as you move the "
+      "markers.")
+print("Press '+' or '-' to zoom the window in or out. You can also resize it by dragging its edges.")
 print("Press 'w' to overwrite the configuration file with the current marker locations, strap length, and length "
       "units.")
 print(f"Strap length has been initialised to {strap_length:.4f}. The ratio between the units of strap length and "
       f"distance in pixels is {real_to_pixel_dist_ratio:.4f}.")
+if shoulder_radius or strap_friction:
+    print(f"The shoulder has a radius of {shoulder_radius:.4f}, and the coefficient of friction between it and the "
+          f"strap is {strap_friction:.4f}.")
 print()
 
 entering_strap_length = False
 entering_real_button_dist = False
+entering_target_angle = False
 text_input_string = ""
 
+# In live mode, any change to the system flags it for solving again, and it's then solved once at the end of the frame.
+#   Each solve is warm-started from the previous solution for the left strap segment length, if there is one, and
+#   likewise from the previous solution of the extended model (including the ends of its range), if it's in use.
+live_mode = False
+live_solve_pending = False
+live_res = None
+live_l_guess = None
+live_state_guess = None
+# What live mode draws is worked out once per solve: the strap, the angle overlay, and the rects they cover (which have
+#   to be redrawn when they change).
+live_strap_surface = None
+live_strap_rect = None
+live_text_surface = None
+live_overlay_rects = []
+
+# The map of the equilibrium angle (toggled by the 'm' key) is rendered in the background, and drawn onto its own
+#   transparent surface, tile by tile, as the tiles come in. The renderer isn't started until it's first needed.
+heatmap_marker = None
+heatmap = None
+heatmap_surface = pg.Surface((scaled_width, scaled_height), pg.SRCALPHA)
+
+# Solves triggered by the 'h' key are run in the background (see gthoi_worker.py), so that the window keeps responding
+#   in the meantime. While one is running, "Solving..." is shown in the bottom left corner, and then the result, until
+#   the system is changed.
+solve_worker = SolveWorker(args.solver_backend)
+# The 'a' and 'u' keys are run in the background too, with "Solving..." shown until they're done, and their results are
+#   printed when they come in.
+task_worker = TaskWorker()
+solve_status_surface = None
+solve_status_rect = None
+solve_status_setup = None
+
+
+# Where the markers are, in pixels (B1, COM and B2). Everything is solved from these, not from the markers' rects, which
+#   are only for drawing and for picking the markers up: those are truncated to whole pixels at the current size of the
+#   window, so the answer would change a little as it's zoomed in and out.
+def marker_positions():
+    return tuple(image_to_pixel(image_coords, image_dim) for image_coords in marker_image_coords)
+
+
+# Everything the solution depends on: the marker positions, the length calibration, the strap length, and the shoulder
+#   radius and strap friction.
+def current_setup():
+    return (*marker_positions(), real_to_pixel_dist_ratio, strap_length, shoulder_radius, strap_friction)
+
+
+# The short description of a solution that's shown in the window, with the range that friction allows, if there is any.
+def angle_text(all_res):
+    text = f"{all_res['total_rot'] * 180 / np.pi:.2f} degrees clockwise"
+    if strap_friction:
+        text += f" ({range_text(all_res)} with friction)"
+    return text
+
+
+# Prints the result of the 'a' key: the strap lengths (from strap_length_for_angle) that give target_angle with the
+#   system as it was in setup (from current_setup()). The strap length is set to the one closest to the current strap
+#   length, unless the markers have been moved or the lengths recalibrated in the meantime.
+def set_target_angle_result(target_angle, strap_res, setup):
+    global strap_length, live_solve_pending
+    if strap_friction:
+        print(FREE_SLIDING_NOTE)
+    if strap_res['strap_lengths'] and setup[:4] != current_setup()[:4]:
+        print(f"The markers have been moved, or the lengths recalibrated, since the target angle of {target_angle:.2f} "
+              f"degrees was entered. The strap length remains {strap_length:.4f}: press 'a' to enter it again.")
+    elif strap_res['strap_lengths']:
+        # Of all the strap lengths that give that angle, go with the closest to the current one.
+        strap_length = min(strap_res['strap_lengths'], key=lambda L: abs(L - strap_length))
+        print(f"A strap length of {strap_length:.4f} gives an equilibrium angle of {target_angle:.2f} degrees "
+              f"clockwise vs. the horizontal. strap_length has been set to that.")
+        if len(strap_res['strap_lengths']) > 1:
+            other_lengths = ", ".join(f"{L:.4f}" for L in strap_res['strap_lengths'] if L != strap_length)
+            print(f"These strap lengths give the same angle: {other_lengths}.")
+        live_solve_pending = live_mode
+    else:
+        stable_rots = strap_res['total_rot'][np.isfinite(strap_res['total_rot'])]
+        print(f"No strap length up to {strap_res['L_values'][-1]:.4f} gives an equilibrium angle of "
+              f"{target_angle:.2f} degrees with the markers where they are.")
+        if stable_rots.size:
+            print(f"The stable angles range from {stable_rots.min() * 180 / np.pi:.2f} to "
+                  f"{stable_rots.max() * 180 / np.pi:.2f} degrees.")
+        print(f"The strap length remains {strap_length:.4f}, in terms of current length units.")
+
+
+# Shows text in the bottom left corner (or nothing, if it's None). setup is what it's the result for, if anything.
+def set_solve_status(text, setup=None):
+    global solve_status_surface, solve_status_rect, solve_status_setup
+    renderer.mark_dirty(solve_status_rect)
+    solve_status_setup = setup
+    if text is None:
+        solve_status_surface = None
+        solve_status_rect = None
+        return
+    solve_status_surface = overlay_font.render(text, True, pg.Color(marker_font_colour), pg.Color(marker_colour))
+    solve_status_rect = solve_status_surface.get_rect(bottomleft=(0, scaled_height))
+    renderer.mark_dirty(solve_status_rect)
+
+
+# Everything that's drawn over the guitar image. The renderer calls this once for each rect that needs redrawing, with
+#   drawing clipped to it, so it's cheap to draw the lot each time.
+def draw_scene(surf):
+    if heatmap_marker is not None:
+        surf.blit(heatmap_surface, surf.get_clip(), surf.get_clip())
+    if live_res:
+        surf.blit(live_strap_surface, live_strap_rect)
+    for marker in markers:
+        marker.draw(surf)
+    if live_mode and live_text_surface is not None:
+        surf.blit(live_text_surface, (0, 0))
+    if solve_status_surface is not None:
+        surf.blit(solve_status_surface, solve_status_rect)
+
+
+# Only what's changed is redrawn each frame: where a marker was and where it is now, the strap and angle overlay
+#   before and after a live solve, and any newly rendered map tiles. Anything else (e.g. toggling the map or live mode)
+#   sets update_screen, which redraws the whole window.
+renderer = DirtyRectRenderer(screen, gitar)
+
+
+# Zooming or resizing the window rescales everything to show the image with its longest side new_image_dim pixels. The
+#   window is then fitted to the image. The markers are put back where they were on the image (whatever pixels they
+#   were at), and the length calibration is converted, so nothing needs recalibrating.
+def resize_window(new_image_dim):
+    global gitar, scaled_width, scaled_height, image_dim, screen, real_to_pixel_dist_ratio, heatmap, heatmap_surface, \
+        renderer, live_solve_pending, update_screen
+    new_image_dim = max(MIN_IMAGE_DIM, int(new_image_dim))
+    if new_image_dim == image_dim:
+        return
+    gitar = guitar_image.scaled(new_image_dim)
+    scaled_width, scaled_height = gitar.get_size()
+    image_dim = max(scaled_width, scaled_height)
+    screen = pg.display.set_mode((scaled_width, scaled_height), pg.RESIZABLE)
+    gitar = gitar.convert()
+    real_to_pixel_dist_ratio = real_to_image_dist_ratio / image_dim
+    for marker, image_coords in zip(markers, marker_image_coords):
+        centre = marker_centre(image_to_pixel(image_coords, image_dim), marker_size)
+        marker.move_ip((centre[0] - marker.rect.centerx, centre[1] - marker.rect.centery))
+    # The map's tiles are for the old size, so it's started again.
+    heatmap_surface = pg.Surface((scaled_width, scaled_height), pg.SRCALPHA)
+    if heatmap is not None:
+        heatmap.shutdown()
+        heatmap = HeatmapRenderer((scaled_width, scaled_height)) if heatmap_marker is not None else None
+    renderer = DirtyRectRenderer(screen, gitar)
+    live_solve_pending = live_mode
+    update_screen = True
+
+
+frame_timer = FrameTimer()
+clock = pg.time.Clock()
 run = True
 update_screen = True
+frame_count = 0
+replay_start = time.perf_counter()
 while run:
+    frame_timer.start_frame()
+    frame_start = time.perf_counter()
 
-    for event in pg.event.get():
+    if session is not None:
+        # The real event queue is still emptied, but what happens is down to the recording.
+        pg.event.get()
+        events = session.events(frame_count)
+    else:
+        events = pg.event.get()
+    if recorder is not None:
+        recorder.record_frame(frame_count, events)
+
+    for event in events:
 
         if event.type == pg.MOUSEBUTTONDOWN:
             if event.button == 1:
@@ -126,11 +393,20 @@ while run:
 
         if event.type == pg.MOUSEMOTION:
             if active_marker is not None:
+                renderer.mark_dirty(markers[active_marker].dirty_rect)
                 markers[active_marker].move_ip(event.rel)
-                update_screen = True
+                renderer.mark_dirty(markers[active_marker].dirty_rect)
+                marker_image_coords[active_marker] = tuple(
+                    coord + rel for coord, rel in zip(marker_image_coords[active_marker],
+                                                      pixel_to_image(event.rel, image_dim)))
+                live_solve_pending = live_mode
+
+        if event.type == pg.VIDEORESIZE:
+            # Fit the image into the new size of the window.
+            resize_window(image_dim * min(event.w / scaled_width, event.h / scaled_height))
 
         if event.type == pg.KEYDOWN:
-            if entering_strap_length or entering_real_button_dist:
+            if entering_strap_length or entering_real_button_dist or entering_target_angle:
                 if event.key == pg.K_BACKSPACE:
                     text_input_string = text_input_string[:-1]
                 elif event.key == pg.K_RETURN:
@@ -139,31 +415,50 @@ while run:
                             strap_length = float(text_input_string)
                             print(f"strap_length is now {strap_length:.4f}")
                             entering_strap_length = False
+                            live_solve_pending = live_mode
                         except ValueError:
                             print(f"{text_input_string} can't be converted to a float. Try entering another value.")
                             print(f"The strap length remains {strap_length:.4f}, in terms of current length units.")
                             print("You are still in strap length editing mode.")
-                    else:  # entering_real_button_dist
+                    elif entering_real_button_dist:
                         try:
                             real_button_dist = float(text_input_string)
                             strap_length_in_pixels = strap_length / real_to_pixel_dist_ratio
-                            button_pixel_dist = np.linalg.norm(
-                                np.array(markers[2].rect.center) - np.array(markers[0].rect.center))
+                            shoulder_radius_in_pixels = shoulder_radius / real_to_pixel_dist_ratio
+                            B1_position, _, B2_position = marker_positions()
+                            button_pixel_dist = np.linalg.norm(np.array(B2_position) - np.array(B1_position))
                             real_to_pixel_dist_ratio = real_button_dist / button_pixel_dist
+                            real_to_image_dist_ratio = real_to_pixel_dist_ratio * image_dim
                             strap_length = strap_length_in_pixels * real_to_pixel_dist_ratio
+                            shoulder_radius = shoulder_radius_in_pixels * real_to_pixel_dist_ratio
                             print(f"The distance between the buttons has been entered as {real_button_dist}. All "
                                   f"lengths are now calibrated against that.")
                             print(f"The existing value of strap length has been converted to a new value of "
                                   f"{strap_length:.4f} to reflect the new units.")
                             entering_real_button_dist = False
+                            live_solve_pending = live_mode
                         except ValueError:
                             print(f"{text_input_string} can't be converted to a float. Try entering another value.")
                             print(f"System length calibration is unchanged from its previous state.")
                             print("You are still in real button distance editing mode.")
+                    else:  # entering_target_angle
+                        try:
+                            target_angle = float(text_input_string)
+                            g1, g2, theta_COM, pre_rot, _ = solver_inputs(*marker_positions())
+                            # (The result is printed, and the strap length set, when it comes in.)
+                            task_worker.submit(('a', target_angle, current_setup()), strap_length_for_angle,
+                                               g1 * real_to_pixel_dist_ratio, g2 * real_to_pixel_dist_ratio,
+                                               theta_COM, target_angle * np.pi / 180, pre_rot,
+                                               shoulder_radius=shoulder_radius)
+                            set_solve_status("Solving...")
+                            entering_target_angle = False
+                        except ValueError:
+                            print(f"{text_input_string} can't be converted to a float. Try entering another value.")
+                            print("You are still in target angle entry mode.")
                     text_input_string = ""
 
         if event.type == pg.TEXTINPUT:
-            if entering_strap_length or entering_real_button_dist:
+            if entering_strap_length or entering_real_button_dist or entering_target_angle:
                 if entering_strap_length and (event.text == "s"):
                     print("Strap length entry aborted.")
                     print(f"The strap length remains {strap_length:.4f}, in terms of current length units.")
@@ -173,64 +468,50 @@ while run:
                     print("Real button distance entry aborted.")
                     text_input_string = ""
                     entering_real_button_dist = False
+                elif entering_target_angle and (event.text == "a"):
+                    print("Target angle entry aborted.")
+                    print(f"The strap length remains {strap_length:.4f}, in terms of current length units.")
+                    text_input_string = ""
+                    entering_target_angle = False
                 else:
                     text_input_string += event.text
             elif event.text == "h":
-                # The user has triggered a solve. So get the hang of it.
-
-                # Before anything else, we'll check that the user hasn't specified a strap length that's shorter than
-                #   the distance between the strap buttons (a constraint violation). This is a specific case that we
-                #   can warn about directly, rather than just having the solver say that the system is unstable.
-                # Take the distance between the strap buttons:
-                g3 = (np.linalg.norm(np.array(markers[2].rect.center) - np.array(markers[0].rect.center)) *
-                      real_to_pixel_dist_ratio)
-                if g3 > strap_length:
-                    print(f"The strap length of {strap_length:.4f} is shorter than the distance between the buttons of "
-                          f"{g3:.4f}. Move the buttons and/or increase the strap length and try again.")
+                # The user has triggered a solve. So get the hang of it. (The result is printed when it comes in.)
+                if solve_worker.request(*current_setup()):
+                    set_solve_status("Solving...")
+            elif event.text in ("+", "="):
+                resize_window(image_dim * ZOOM_FACTOR)
+            elif event.text == "-":
+                resize_window(image_dim / ZOOM_FACTOR)
+            elif event.text == "u":
+                # (The report is printed when it comes in.)
+                task_worker.submit(('u',), equilibrium_uncertainty, *marker_positions(), real_to_pixel_dist_ratio,
+                                   strap_length, uncertainties=args.uncertainties, shoulder_radius=shoulder_radius)
+                set_solve_status("Solving...")
+            elif event.text == "l":
+                live_mode = not live_mode
+                live_solve_pending = live_mode
+                live_res = None
+                live_l_guess = None
+                live_state_guess = None
+                live_overlay_rects = []
+                update_screen = True
+                print(f"Live mode is now {'on' if live_mode else 'off'}.")
+            elif event.text == "m":
+                heatmap_marker = {None: 'B2', 'B2': 'COM', 'COM': None}[heatmap_marker]
+                if heatmap_marker is None:
+                    heatmap.cancel()
+                    print("The map is now off.")
                 else:
-                    # First, we need to compute the inputs to the solver: we need to get the angle theta_COM between the
-                    #   two vectors that the buttons define vs. the COM, and we need to compute the (left-handed) pre-
-                    #   rotation that places the system into the state in terms of which the solver is defined.
-                    # We are using clockwise-positive/left-handed conventions for our angles, as decided offline. This
-                    #   is the simplest way of expressing things given our choices in the original derivation:
-                    v1 = np.array(markers[0].rect.center) - np.array(markers[1].rect.center)
-                    v2 = np.array(markers[2].rect.center) - np.array(markers[1].rect.center)
-                    # And then we have to correct for the Original Sin of graphics and get positive y pointing upwards
-                    #   like it's supposed to:
-                    v1[1] = -v1[1]
-                    v2[1] = -v2[1]
-
-                    reference_ax = np.array([-1, 0])
-                    # theta_v2_v1 = np.arctan2(np.cross(v2, v1), np.dot(v1, v2))
-                    theta_v2_v1 = np.arctan2(cross2d(v2, v1), np.dot(v1, v2))
-                    if theta_v2_v1 >= 0:
-                        # The vector that will be rotated clockwise to (-1, 0) is v1
-                        theta_COM = theta_v2_v1
-                        g1 = np.linalg.norm(v1)
-                        g2 = np.linalg.norm(v2)
-                        # pre_rot = np.arctan2(np.cross(reference_ax, v1), np.dot(v1, reference_ax))
-                        pre_rot = np.arctan2(cross2d(reference_ax, v1), np.dot(v1, reference_ax))
-                    else:
-                        # The vector that will be rotated clockwise to (-1, 0) is v2
-                        theta_COM = -theta_v2_v1
-                        g1 = np.linalg.norm(v2)
-                        g2 = np.linalg.norm(v1)
-                        # pre_rot = np.arctan2(np.cross(reference_ax, v2), np.dot(v2, reference_ax))
-                        pre_rot = np.arctan2(cross2d(reference_ax, v2), np.dot(v2, reference_ax))
-                    # We'll put everything into "real" units of length, according to the current calibration, such that
-                    #   the left-side strap length is returned in units consistent with the representation of the total
-                    #   strap length, as you'd expect:
-                    all_res = gthoi_solver(g1 * real_to_pixel_dist_ratio,
-                                           g2 * real_to_pixel_dist_ratio,
-                                           theta_COM,
-                                           strap_length)
-                    if all_res:
-                        post_rot = all_res['guitar_angle']
-                        total_rot = pre_rot + post_rot
-                        print(f"Equilibrium angle is {total_rot * 180 / np.pi:.2f} degrees clockwise vs. the "
-                              f"horizontal.")
-                    else:
-                        print("Unstable design. Not recommended.")
+                    if heatmap is None:
+                        heatmap = HeatmapRenderer((scaled_width, scaled_height))
+                    print(f"The map now shows the equilibrium angle for every position of {heatmap_marker}, with the "
+                          f"other markers where they are: blue for the neck pointing straight up, through green at "
+                          f"-45 degrees, yellow at horizontal, and red for the neck pointing straight down. Unstable "
+                          f"positions are left uncoloured.")
+                    if strap_friction:
+                        print(FREE_SLIDING_NOTE)
+                update_screen = True
             elif event.text == "s":
                 print()
                 print("You are now entering the length of the strap, in terms of the units defined by the provided "
@@ -246,19 +527,32 @@ while run:
                 print("Type in a string that can be converted to a float and press Return. You can use Backspace. "
                       "Press 'd' again at any time to abort and retain the current state.")
                 entering_real_button_dist = True
+            elif event.text == "a":
+                print()
+                print("You are now entering a target equilibrium angle, in degrees clockwise vs. the horizontal, and "
+                      "the strap length will be set to give that angle, if there is one that does.")
+                print("Type in a string that can be converted to a float and press Return. You can use Backspace. "
+                      "Press 'a' again at any time to abort and retain the current value of the strap length.")
+                entering_target_angle = True
+            elif event.text == "w" and session is not None:
+                print()
+                print(f"(Replaying, so {args.config_file} hasn't been overwritten.)")
             elif event.text == "w":
-                configs['B1_init_pixel_coords'] = markers[0].rect.center
-                configs['COM_init_pixel_coords'] = markers[1].rect.center
-                configs['B2_init_pixel_coords'] = markers[2].rect.center
-                configs['init_real_to_pixel_dist_ratio'] = real_to_pixel_dist_ratio
+                # (An older config file, in pixels, is brought up to date.)
+                for name, image_coords in zip(MARKER_NAMES, marker_image_coords):
+                    configs.pop(f'{name}_init_pixel_coords', None)
+                    configs[f'{name}_init_image_coords'] = list(image_coords)
+                configs.pop('init_real_to_pixel_dist_ratio', None)
+                configs['init_real_to_image_dist_ratio'] = real_to_image_dist_ratio
                 configs['init_strap_length'] = strap_length
+                if shoulder_radius:
+                    configs['shoulder_radius'] = shoulder_radius
                 with open(args.config_file, mode="w") as config_file:
                     json.dump(configs, config_file, indent=4)
                 print()
                 print(f"NOTE --> Initial values of marker locations (strap buttons and C.O.M.), strap length, and "
-                      f"length units in terms of pixels in {args.config_file} have all been overwritten with their "
-                      f"current values. When you next load {args.config_file}, you'll be starting from this "
-                      f"configuration.")
+                      f"length units in {args.config_file} have all been overwritten with their current values. "
+                      f"When you next load {args.config_file}, you'll be starting from this configuration.")
             else:
                 # No other cases at present. Just keeping this here for clarity.
                 pass
@@ -266,11 +560,143 @@ while run:
         if event.type == pg.QUIT:
             run = False
 
+    if live_solve_pending:
+        # This is the same solve as the 'h' key, but warm-started from the last solution, and drawn rather than printed.
+        B1_position, COM_position, B2_position = marker_positions()
+        if button_distance(B1_position, B2_position, real_to_pixel_dist_ratio) > strap_length:
+            live_res = {}
+        else:
+            live_res = equilibrium(B1_position, COM_position, B2_position, real_to_pixel_dist_ratio, strap_length,
+                                   l_guess=live_l_guess, table=lookup_table,
+                                   shoulder_radius=shoulder_radius, strap_friction=strap_friction,
+                                   state_guess=live_state_guess)
+        live_l_guess = live_res['left_strap_seg_len'] if live_res else None
+        live_state_guess = live_res.get('extended_state') if live_res else None
+        live_solve_pending = False
+
+        renderer.mark_dirty(*live_overlay_rects)
+        if live_res:
+            live_text = angle_text(live_res)
+        else:
+            live_text = "Unstable design, or strap too short"
+        live_text_surface = overlay_font.render(live_text, True, pg.Color(marker_font_colour),
+                                                pg.Color(marker_colour))
+        live_overlay_rects = [live_text_surface.get_rect()]
+        if live_res:
+            # The strap is drawn onto its own transparent surface, covering the part of the window that it's in, so
+            #   that it comes out the same whichever rects it's redrawn in. (A thick line is drawn a little differently
+            #   depending on where it's clipped.)
+            strap_points = strap_pixel_path(B1_position, B2_position, live_res, real_to_pixel_dist_ratio,
+                                            shoulder_radius)
+            xs, ys = zip(*strap_points)
+            live_strap_rect = pg.Rect(min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1).inflate(
+                2 * STRAP_LINE_WIDTH, 2 * STRAP_LINE_WIDTH).clip(screen.get_rect())
+            live_strap_surface = pg.Surface(live_strap_rect.size, pg.SRCALPHA)
+            pg.draw.lines(live_strap_surface, pg.Color(marker_colour), False,
+                          [(x - live_strap_rect.x, y - live_strap_rect.y) for x, y in strap_points], STRAP_LINE_WIDTH)
+            live_overlay_rects.append(live_strap_rect)
+        renderer.mark_dirty(*live_overlay_rects)
+
+    # If the system has changed while a solve is running, that solve is out of date, so it's replaced by one for the
+    #   system as it is now. Once the system changes, any result shown is out of date too.
+    if solve_worker.is_busy():
+        solve_worker.request(*current_setup())
+    elif solve_status_setup is not None and solve_status_setup != current_setup():
+        set_solve_status(None)
+    if session is None:
+        solve_result = solve_worker.poll()
+    elif session.solve_came_in(frame_count):
+        # In a replay, a result comes in in the same frame as in the recording, however long the solve takes (see
+        #   gthoi_session.py).
+        solve_worker.wait()
+        solve_result = solve_worker.poll()
+    else:
+        solve_result = None
+    if solve_result is not None:
+        solve_text, solve_res, solve_setup = solve_result
+        print(solve_text)
+        if recorder is not None:
+            recorder.record_solve(frame_count, solve_text)
+        if session is not None:
+            session.messages.append(solve_text)
+        if solve_res:
+            set_solve_status(angle_text(solve_res), solve_setup)
+        else:
+            set_solve_status("Strap too short" if solve_res is None else "Unstable design", solve_setup)
+
+    # Likewise for the 'a' and 'u' keys, which come in in the order they were asked for.
+    if session is None:
+        task_result = task_worker.poll()
+    elif session.task_came_in(frame_count):
+        task_worker.wait()
+        task_result = task_worker.poll()
+    else:
+        task_result = None
+    if task_result is not None:
+        task_tag, task_res = task_result
+        if recorder is not None:
+            recorder.record_task(frame_count)
+        if task_tag[0] == 'u':
+            print()
+            print(uncertainty_report(task_res, args.uncertainties))
+            if strap_friction:
+                print(FREE_SLIDING_NOTE)
+        else:
+            set_target_angle_result(task_tag[1], task_res, task_tag[2])
+        # "Solving..." is cleared once nothing's left running (but a result from 'h' is left up).
+        if solve_status_setup is None and not solve_worker.is_busy() and not task_worker.is_busy():
+            set_solve_status(None)
+
+    if heatmap_marker is not None:
+        if heatmap.request(heatmap_marker, *marker_positions(), real_to_pixel_dist_ratio, strap_length,
+                           shoulder_radius):
+            heatmap_surface.fill((0, 0, 0, 0))
+            update_screen = True
+        for (x, y, width, height), _, rgba in heatmap.poll():
+            # Adding onto a cleared rect just copies the tile over, alpha and all.
+            heatmap_surface.fill((0, 0, 0, 0), (x, y, width, height))
+            heatmap_surface.blit(pg.image.frombuffer(rgba.tobytes(), (width, height), 'RGBA'), (x, y),
+                                 special_flags=pg.BLEND_RGBA_ADD)
+            renderer.mark_dirty((x, y, width, height))
+
     if update_screen:
-        screen.blit(gitar, (0, 0))
-        for marker in markers:
-            marker.draw(screen)
-        pg.display.flip()
+        renderer.mark_all()
         update_screen = False
+    render_start = time.perf_counter()
+    if renderer.render(draw_scene):
+        frame_timer.record_render(time.perf_counter() - render_start)
+        if session is not None:
+            session.render_times.append(time.perf_counter() - render_start)
 
+    frame_count += 1
+    if args.frame_times and frame_count % FRAME_TIMES_CAPTION_INTERVAL == 0:
+        pg.display.set_caption(f"Get the Hang of It ({frame_timer})")
+
+    if session is not None:
+        # A replay runs flat out, and stops at the end of the recording (if the window wasn't closed before that).
+        session.frame_times.append(time.perf_counter() - frame_start)
+        run = run and not session.is_done(frame_count)
+    else:
+        clock.tick(MAX_FRAME_RATE)
+
+if args.frame_times:
+    print(f"Frame times, over the last few seconds: {frame_timer}")
+if heatmap is not None:
+    heatmap.shutdown()
+solve_worker.shutdown()
+task_worker.shutdown()
 pg.quit()
+
+if recorder is not None:
+    recorder.save()
+    print(f"The session has been recorded to {args.record}.")
+if session is not None:
+    session.solve_times = solve_worker.solve_times
+    replay_report = session.report(time.perf_counter() - replay_start)
+    print()
+    print(replay_summary(replay_report))
+    if args.replay_output:
+        with open(args.replay_output, mode="w") as replay_output_file:
+            json.dump(replay_report, replay_output_file, indent=4)
+    if replay_report['mismatches']:
+        raise SystemExit(1)
@@ -0,0 +1,147 @@
+# NL: Solves a whole collection of config files (the same kind of file as config/config.json, e.g. one for each guitar
+#   and strap combination) without opening the GUI, e.g.
+#   python gthoi_batch.py "config/*.json" --format csv --output results.csv
+# Each config file is solved exactly as it would be by pressing 'h' straight after loading it in get_the_hang_of_it.py,
+#   i.e. from its initial marker positions, length calibration and strap length. The files are spread over a pool of
+#   worker processes, and each result is written out as soon as it's done, so the results come out in no particular
+#   order. A file that can't be read or solved gets a status saying so, rather than stopping the whole run.
+# With --lookup-table, the solves are looked up in a precomputed table (see gthoi_table.py) where it's accurate enough,
+#   as in live mode in get_the_hang_of_it.py. Each worker process opens the table once, and shares the memory-mapped
+#   file with the others.
+
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from gthoi_geometry import config_equilibrium
+from gthoi_solver import SOLVER_BACKENDS
+from gthoi_table import DEFAULT_TABLE_PATH, EquilibriumTable
+
+
+# The fields written out for each config file. 'status' is one of 'ok', 'unstable', 'strap_too_short' or 'error', and
+#   the solution fields are empty unless it's 'ok'. 'equilibrium_angle' is what the 'h' key prints: degrees clockwise
+#   vs. the horizontal of the image. For a config file that chooses the extended model with strap friction (see
+#   gthoi_geometry.py), 'equilibrium_angle_min' and 'equilibrium_angle_max' are the ends of the range of those angles
+#   that friction can hold the guitar at (each empty if it can't be found, e.g. if it's past vertical). The other three
+#   are as returned by gthoi_solver (in radians, and in the length units of the config file).
+RESULT_FIELDS = ('config_file', 'status', 'equilibrium_angle', 'equilibrium_angle_min', 'equilibrium_angle_max',
+                 'guitar_angle', 'left_strap_seg_len', 'strap_angle', 'error')
+
+
+# The lookup tables opened so far in this process, by path, so that each worker opens a table just once.
+_tables = {}
+
+
+def _lookup_table(table_path):
+    if table_path not in _tables:
+        _tables[table_path] = EquilibriumTable(table_path)
+    return _tables[table_path]
+
+
+def solve_config_file(config_path, backend='numpy', table_path=None):
+    """Solves a single config file, returning a dict with the RESULT_FIELDS. If table_path is given, the lookup table
+    there is used where it can be, as with --lookup-table."""
+    result = dict.fromkeys(RESULT_FIELDS)
+    result['config_file'] = config_path
+    try:
+        with open(config_path, mode="r") as config_file:
+            configs = json.load(config_file)
+        all_res = config_equilibrium(configs, backend=backend,
+                                     table=_lookup_table(table_path) if table_path else None)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+
+    if all_res is None:
+        result['status'] = 'strap_too_short'
+    elif not all_res:
+        result['status'] = 'unstable'
+    else:
+        result['status'] = 'ok'
+        result['equilibrium_angle'] = float(all_res['total_rot'] * 180 / np.pi)
+        if 'total_rot_range' in all_res and configs.get('strap_friction'):
+            result['equilibrium_angle_min'], result['equilibrium_angle_max'] = (
+                float(rot * 180 / np.pi) if np.isfinite(rot) else None for rot in all_res['total_rot_range'])
+        for key in ('guitar_angle', 'left_strap_seg_len', 'strap_angle'):
+            result[key] = float(all_res[key])
+    return result
+
+
+def _solve_config_file_star(job):
+    return solve_config_file(*job)
+
+
+def solve_config_files(config_paths, backend='numpy', workers=None, chunksize=None, table_path=None):
+    """Yields the result of solve_config_file for each of config_paths, in whatever order they finish.
+
+    workers defaults to the number of CPUs. Handing the files to the workers in chunks keeps the overhead of passing
+    them between processes small next to the solves themselves, which is what lets this scale with the number of
+    workers. The default chunksize gives each worker a few chunks, so that none of them ends up waiting on a slow
+    one. The lookup table at table_path (if given) is passed to the workers by its path, rather than loaded here."""
+    workers = workers or os.cpu_count()
+    jobs = [(path, backend, table_path) for path in config_paths]
+    if workers == 1:
+        yield from map(_solve_config_file_star, jobs)
+        return
+    if chunksize is None:
+        chunksize = max(1, min(64, len(jobs) // (4 * workers)))
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(_solve_config_file_star, jobs, chunksize=chunksize)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config_globs', nargs='+',
+                        help="Glob patterns for the config files to solve, e.g. \"config/*.json\" (quoted, so that "
+                             "the pattern isn't expanded by the shell first, which may hit a limit on the number of "
+                             "arguments with thousands of files).")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl',
+                        help="The output format: one JSON object per line, or CSV with a header row.")
+    parser.add_argument('--output', default=None,
+                        help="The file to write the results to. Defaults to the standard output.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="The number of worker processes. Defaults to the number of CPUs.")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="The number of config files handed to a worker at a time.")
+    parser.add_argument('--solver-backend', choices=SOLVER_BACKENDS, default='numpy',
+                        help="The method used to solve the quartic. 'sympy' is much slower, and is kept as a "
+                             "reference.")
+    parser.add_argument('--lookup-table', nargs='?', const=DEFAULT_TABLE_PATH, default=None, metavar='TABLE_PATH',
+                        help="Use a precomputed lookup table (see gthoi_table.py) for the solves, falling back to the "
+                             "exact solver where the table isn't accurate enough. Defaults to "
+                             f"{DEFAULT_TABLE_PATH} if no path is given.")
+    args = parser.parse_args()
+
+    missing_table_files = EquilibriumTable(args.lookup_table).missing_files() if args.lookup_table else []
+    if missing_table_files:
+        build_command = "python gthoi_table.py" + (f" --output {args.lookup_table}"
+                                                   if args.lookup_table != DEFAULT_TABLE_PATH else "")
+        parser.error(f"--lookup-table: {' and '.join(missing_table_files)} not found. Build the table first, with "
+                     f"{build_command}")
+
+    config_paths = sorted({path for pattern in args.config_globs for path in glob.glob(pattern, recursive=True)})
+    if not config_paths:
+        parser.error(f"No config files match {args.config_globs}.")
+
+    output_file = open(args.output, mode="w", newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'csv':
+            writer = csv.DictWriter(output_file, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+        for result in solve_config_files(config_paths, backend=args.solver_backend, workers=args.workers,
+                                         chunksize=args.chunksize, table_path=args.lookup_table):
+            if args.format == 'csv':
+                writer.writerow(result)
+            else:
+                output_file.write(json.dumps(result) + '\n')
+            output_file.flush()
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
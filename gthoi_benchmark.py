@@ -0,0 +1,366 @@
+# NL: Benchmarks for keeping track of performance. Run e.g.
+#   python gthoi_benchmark.py startup
+# and see --help for the options. Results are printed, and can also be written out as JSON with --output, for
+#   comparison between runs.
+# startup: the time it takes to get going, measured in fresh interpreters. That's the time to import the solver stack,
+#   the time for the first solve of a config file (as with get_the_hang_of_it.py --headless), and the time to import and
+#   initialise pygame and the marker module, which only the GUI pays for. The wall time of a whole headless run is
+#   measured as well.
+# solver: the latency of single solves, the throughput of batch solves and the memory they use, for each of the solver
+#   methods in SOLVER_METHODS, and their accuracy against a reference solved to REFERENCE_DPS digits with mpmath. It's
+#   run on reproducible random geometries (from --seed), and on hard cases that sit just either side of the border
+#   between stable and unstable designs (the SG-style instability; see gthoi_solver), where a pair of roots of the
+#   quartic is (nearly) coincident, and the numerical solvers see them with tiny imaginary parts.
+# Pass --compare with the JSON written by an earlier run (with --output) to flag any regressions against it. The exit
+#   status is non-zero if there are any.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from gthoi_solver import STATUS_OK, gthoi_solver, gthoi_solver_batch, gthoi_solver_warm, random_geometries
+
+
+# This runs in each fresh interpreter for the startup benchmark, and prints its timings (in seconds) as JSON.
+STARTUP_SNIPPET = """
+import json, os, sys, time
+t_0 = time.perf_counter()
+import gthoi_geometry
+t_1 = time.perf_counter()
+with open(sys.argv[1], mode="r") as config_file:
+    configs = json.load(config_file)
+gthoi_geometry.equilibrium(*gthoi_geometry.config_marker_centres(configs),
+                           gthoi_geometry.config_real_to_pixel_dist_ratio(configs), configs['init_strap_length'])
+t_2 = time.perf_counter()
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+import pygame
+import basic_marker
+pygame.init()
+t_3 = time.perf_counter()
+print(json.dumps({'solver_import': t_1 - t_0, 'first_solve': t_2 - t_1, 'gui_import_and_init': t_3 - t_2}))
+"""
+
+
+def _repo_dir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def benchmark_startup(config_file, n_runs=5):
+    """Returns the median startup timings over n_runs fresh interpreters, in seconds."""
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', SDL_AUDIODRIVER='dummy')
+    runs = []
+    for _ in range(n_runs):
+        out = subprocess.run([sys.executable, '-c', STARTUP_SNIPPET, config_file], cwd=_repo_dir(), env=env,
+                             check=True, capture_output=True, text=True).stdout
+        run = json.loads(out.strip().splitlines()[-1])
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'get_the_hang_of_it.py', '--headless', config_file], cwd=_repo_dir(),
+                       env=env, check=True, capture_output=True)
+        run['headless_wall_time'] = time.perf_counter() - start
+        runs.append(run)
+    return {key: float(np.median([run[key] for run in runs])) for key in runs[0]}
+
+
+# The solver methods that the solver benchmark covers: gthoi_solver with each of its backends, gthoi_solver_batch (whose
+#   latency is for a batch of one) and gthoi_solver_warm (warm-started from a guess WARM_GUESS_RTOL away from the
+#   reference solution, as in live mode).
+SOLVER_METHODS = ('numpy', 'sympy', 'batch', 'warm')
+
+WARM_GUESS_RTOL = 1e-3
+
+# The number of decimal digits that the reference solutions are worked out to.
+REFERENCE_DPS = 50
+
+# The hard cases are offset from the border between stable and unstable designs by a random fraction of theta_COM, of
+#   between these orders of magnitude (either way).
+HARD_CASE_OFFSET_RANGE = (-9, -4)
+
+# The keys of the result_dict that accuracy is measured on. The error in 'left_strap_seg_len' is as a fraction of L.
+ACCURACY_KEYS = ('guitar_angle', 'left_strap_seg_len', 'strap_angle')
+
+# With --compare, a timing counts as a regression if it's more than this fraction slower than the baseline (or a
+#   throughput this fraction lower), and an error if it's more than this fraction larger, as well as above
+#   ACCURACY_FLOOR (below which differences are just round-off).
+DEFAULT_REGRESSION_TOLERANCE = 0.25
+ACCURACY_FLOOR = 1e-12
+
+
+def hard_geometries(n, rng, g_range=(10.0, 200.0), slack_range=(1.02, 3.0), n_scan=256, n_bisect=60):
+    """Draws n random geometries (g_1, g_2, theta_COM, L) just either side of the border between stable and unstable.
+
+    For each draw of g_1, g_2 and the slack (L as a multiple of the distance between the buttons), theta_COM is scanned
+    up to pi for the first change of stability, which is then found by bisection, and offset from by a tiny random
+    amount (see HARD_CASE_OFFSET_RANGE). Draws with no change of stability are replaced, until there are n of them."""
+    def solve_status(g_1, g_2, theta_COM, slack):
+        g_3 = np.sqrt(g_1**2 + g_2**2 - 2*g_1*g_2*np.cos(theta_COM))
+        return gthoi_solver_batch(g_1, g_2, theta_COM, slack * g_3)['status'] == STATUS_OK
+
+    found = [[], [], [], []]
+    while len(found[0]) < n:
+        m = 2 * (n - len(found[0]))
+        g_1, g_2 = rng.uniform(*g_range, size=m), rng.uniform(*g_range, size=m)
+        slack = rng.uniform(*slack_range, size=m)
+        scan = np.linspace(1.6, np.pi, n_scan)
+        stable = solve_status(g_1[:, np.newaxis], g_2[:, np.newaxis], scan, slack[:, np.newaxis])
+        changes = stable[:, 1:] != stable[:, :-1]
+        keep = np.any(changes, axis=-1)
+        first = np.argmax(changes, axis=-1)[keep]
+        g_1, g_2, slack, lo_stable = g_1[keep], g_2[keep], slack[keep], stable[keep, first]
+        lo, hi = scan[first], scan[first + 1]
+        for _ in range(n_bisect):
+            mid = (lo + hi) / 2
+            same = solve_status(g_1, g_2, mid, slack) == lo_stable
+            lo, hi = np.where(same, mid, lo), np.where(same, hi, mid)
+        offset = rng.choice((-1.0, 1.0), size=lo.size) * 10.0**rng.uniform(*HARD_CASE_OFFSET_RANGE, size=lo.size)
+        theta_COM = np.minimum((lo + hi) / 2 * (1 + offset), np.pi)
+        g_3 = np.sqrt(g_1**2 + g_2**2 - 2*g_1*g_2*np.cos(theta_COM))
+        for values, new in zip(found, (g_1, g_2, theta_COM, slack * g_3)):
+            values.extend(new)
+    return tuple(np.array(values[:n]) for values in found)
+
+
+def reference_solve(g_1, g_2, theta_COM, L, dps=REFERENCE_DPS):
+    """Solves the system as gthoi_solver does, but working to dps decimal digits with mpmath throughout, from the
+    coefficients of the quartic on. Returns the same result_dict (as floats), or {} if the design is unstable."""
+    import mpmath
+
+    with mpmath.workdps(dps):
+        g_1, g_2, theta_COM, L = (mpmath.mpf(float(x)) for x in (g_1, g_2, theta_COM, L))
+        A = (g_1/g_2) / mpmath.sin(theta_COM)
+        B = 1 / mpmath.tan(theta_COM)
+        g_3_sq = g_1**2 + g_2**2 - 2*g_1*g_2*mpmath.cos(theta_COM)
+        C_4 = -4*(1 + A**2 - 2*A*B + B**2)
+        C_3 = 4*L*(1 + A**2 - 2*A*B + B**2) - 4*(2*A*B*L - 2*L*A**2)
+        C_2 = (g_3_sq - L**2)*(1 + A**2 - 2*A*B + B**2) + 4*L*(2*A*B*L - 2*L*A**2) - 4*(A**2*L**2 - g_1**2)
+        C_1 = 4*A**2*L**3 + (g_3_sq - L**2)*(2*A*B*L - 2*L*A**2) - 4*g_1**2*L
+        C_0 = (g_3_sq - L**2)*A**2*L**2
+        roots = mpmath.polyroots([C_4, C_3, C_2, C_1, C_0], maxsteps=200, extraprec=2*dps)
+        # At this precision, anything that's really a real root has an imaginary part many orders of magnitude below
+        #   anything the double-precision solvers could resolve.
+        real_l = [mpmath.re(r) for r in roots if abs(mpmath.im(r)) <= mpmath.mpf(10)**(-dps//2) * abs(r)]
+        if len(real_l) != 2:
+            return {}
+
+        best = None
+        for l in real_l:
+            theta_g = mpmath.atan(A*(L/l - 1) + B)
+            cos_theta_s = g_1 * mpmath.cos(theta_g) / l
+            if abs(cos_theta_s) > 1:
+                continue
+            theta_s = mpmath.acos(cos_theta_s)
+            err = abs(mpmath.sin(theta_g)*g_1 + mpmath.sin(theta_s)*l -
+                      ((L-l)*mpmath.sin(theta_s) + g_2*mpmath.sin(mpmath.pi-theta_COM-theta_g)))
+            if best is None or err < best[0]:
+                best = (err, theta_g, l, theta_s)
+        if best is None:
+            return {}
+        return {'guitar_angle': float(best[1]), 'left_strap_seg_len': float(best[2]), 'strap_angle': float(best[3])}
+
+
+def _solve_one(method, g_1, g_2, theta_COM, L, l_guess):
+    """A single solve with one of SOLVER_METHODS, returning a result_dict as gthoi_solver does."""
+    if method == 'batch':
+        row = gthoi_solver_batch(g_1, g_2, theta_COM, L)
+        return {key: float(row[key]) for key in ACCURACY_KEYS} if row['stable'] else {}
+    if method == 'warm':
+        return gthoi_solver_warm(g_1, g_2, theta_COM, L, l_guess)
+    try:
+        return gthoi_solver(g_1, g_2, theta_COM, L, backend=method)
+    except AssertionError:
+        # A failed final check, which gthoi_solver_batch reports as STATUS_RESIDUAL: counted as unstable here.
+        return {}
+
+
+def _accuracy(results, references, L):
+    """Compares results with references (both lists of result_dicts) for the geometries with strap lengths L."""
+    stability_mismatches = sum(bool(res) != bool(ref) for res, ref in zip(results, references))
+    max_err = dict.fromkeys(ACCURACY_KEYS, 0.0)
+    for res, ref, L_i in zip(results, references, L):
+        if res and ref:
+            for key in ACCURACY_KEYS:
+                err = abs(float(res[key]) - ref[key])
+                max_err[key] = max(max_err[key], err / L_i if key == 'left_strap_seg_len' else err)
+    return {'n': len(results), 'n_stable': sum(bool(ref) for ref in references),
+            'stability_mismatches': stability_mismatches, 'max_err': max_err}
+
+
+def _latency_stats(seconds):
+    return {'n': len(seconds), 'median': float(np.median(seconds)), 'p95': float(np.percentile(seconds, 95)),
+            'mean': float(np.mean(seconds))}
+
+
+def _peak_memory(func):
+    """The peak memory (in bytes) allocated while running func, as traced by tracemalloc (which NumPy reports to)."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_solver(n_geometries=200, n_hard=200, batch_size=100000, seed=0, methods=SOLVER_METHODS, n_repeats=3):
+    """Returns the latency, throughput, memory and accuracy of each of methods (see SOLVER_METHODS).
+
+    Latency and accuracy are measured on n_geometries random geometries plus n_hard hard cases (see hard_geometries),
+    with times in seconds. Throughput is in solves per second: for 'batch', it's the best of n_repeats batches of
+    batch_size random geometries, and for the rest, it's the best of n_repeats passes through those same cases, one
+    solve at a time (of which the first is the one the latency comes from). Memory is the peak in bytes, for a single
+    solve, and also for a whole batch."""
+    rng = np.random.default_rng(seed)
+    case_sets = {'random': random_geometries(n_geometries, rng), 'hard': hard_geometries(n_hard, rng)}
+    references = {name: [reference_solve(*geometry) for geometry in zip(*geometries)]
+                  for name, geometries in case_sets.items()}
+
+    results = {'seed': seed, 'reference_dps': REFERENCE_DPS, 'latency': {}, 'throughput': {}, 'memory': {},
+               'accuracy': {name: {} for name in case_sets}}
+    for method in methods:
+        pass_times = []
+        for i in range(n_repeats):
+            seconds = []
+            for name, geometries in case_sets.items():
+                solved = []
+                for g_1, g_2, theta_COM, L, ref in zip(*geometries, references[name]):
+                    l_guess = ref['left_strap_seg_len'] * (1 + WARM_GUESS_RTOL) if ref else L / 2
+                    start = time.perf_counter()
+                    solved.append(_solve_one(method, g_1, g_2, theta_COM, L, l_guess))
+                    seconds.append(time.perf_counter() - start)
+                if i == 0:
+                    results['accuracy'][name][method] = _accuracy(solved, references[name], geometries[3])
+            if i == 0:
+                results['latency'][method] = _latency_stats(seconds)
+            pass_times.append(sum(seconds))
+        results['throughput'][method] = {'solves_per_second': len(seconds) / min(pass_times)}
+        g_1, g_2, theta_COM, L = (x[0] for x in case_sets['random'])
+        results['memory'][method] = {'single_solve': _peak_memory(
+            lambda: _solve_one(method, g_1, g_2, theta_COM, L, L / 2))}
+
+    if 'batch' in methods:
+        geometries = random_geometries(batch_size, rng)
+        gthoi_solver_batch(*geometries)
+        best = min(_time(lambda: gthoi_solver_batch(*geometries)) for _ in range(n_repeats))
+        results['throughput']['batch'] = {'solves_per_second': batch_size / best, 'batch_size': batch_size,
+                                          'batch_time': best}
+        results['memory']['batch']['batch'] = _peak_memory(lambda: gthoi_solver_batch(*geometries))
+        results['memory']['batch']['batch_per_solve'] = results['memory']['batch']['batch'] / batch_size
+    return results
+
+
+def _time(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def compare_solver_results(results, baseline, tolerance=DEFAULT_REGRESSION_TOLERANCE):
+    """Returns a description of each regression in results (from benchmark_solver) vs. baseline (from an earlier run),
+    for the methods that both of them cover."""
+    regressions = []
+    for method, stats in results['latency'].items():
+        base = baseline['latency'].get(method)
+        if base and stats['median'] > base['median'] * (1 + tolerance):
+            regressions.append(f"{method} median latency: {stats['median'] * 1e6:.1f} us vs. "
+                               f"{base['median'] * 1e6:.1f} us")
+    for method, stats in results['throughput'].items():
+        base = baseline['throughput'].get(method)
+        if base and stats['solves_per_second'] < base['solves_per_second'] * (1 - tolerance):
+            regressions.append(f"{method} throughput: {stats['solves_per_second']:.0f}/s vs. "
+                               f"{base['solves_per_second']:.0f}/s")
+    for name, by_method in results['accuracy'].items():
+        for method, acc in by_method.items():
+            base = baseline['accuracy'].get(name, {}).get(method)
+            if not base:
+                continue
+            if acc['stability_mismatches'] > base['stability_mismatches']:
+                regressions.append(f"{method} stability mismatches on {name} geometries: "
+                                   f"{acc['stability_mismatches']} vs. {base['stability_mismatches']}")
+            for key, err in acc['max_err'].items():
+                if err > max(base['max_err'][key] * (1 + tolerance), ACCURACY_FLOOR):
+                    regressions.append(f"{method} max error in {key} on {name} geometries: {err:.3g} vs. "
+                                       f"{base['max_err'][key]:.3g}")
+    return regressions
+
+
+def _print_solver_results(results):
+    print("Latency (us):")
+    for method, stats in results['latency'].items():
+        print(f"  {method:>8}: median {stats['median'] * 1e6:10.1f}, p95 {stats['p95'] * 1e6:10.1f}, "
+              f"mean {stats['mean'] * 1e6:10.1f}")
+    print("Throughput (solves per second):")
+    for method, stats in results['throughput'].items():
+        print(f"  {method:>8}: {stats['solves_per_second']:12.0f}")
+    print("Peak memory (bytes):")
+    for method, stats in results['memory'].items():
+        print(f"  {method:>8}: " + ", ".join(f"{key} {value:.0f}" for key, value in stats.items()))
+    for name, by_method in results['accuracy'].items():
+        print(f"Accuracy vs. the reference, {name} geometries (max errors; left_strap_seg_len as a fraction of L):")
+        for method, acc in by_method.items():
+            errs = ", ".join(f"{key} {err:.2e}" for key, err in acc['max_err'].items())
+            print(f"  {method:>8}: {acc['stability_mismatches']} of {acc['n']} disagree on stability "
+                  f"({acc['n_stable']} stable); {errs}")
+
+
+def _print_timings(title, timings):
+    print(title)
+    for key, seconds in timings.items():
+        print(f"  {key:>24}: {seconds * 1e3:10.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices=('startup', 'solver'),
+                        help="Which benchmark to run.")
+    parser.add_argument('--config-file', default='config/config.json',
+                        help="The config file to solve in the startup benchmark.")
+    parser.add_argument('--runs', type=int, default=5,
+                        help="The number of fresh interpreters to take the median over in the startup benchmark.")
+    parser.add_argument('--geometries', type=int, default=200,
+                        help="The number of random geometries for the latency and accuracy in the solver benchmark.")
+    parser.add_argument('--hard', type=int, default=200,
+                        help="The number of hard cases, near the border between stable and unstable designs, for the "
+                             "latency and accuracy in the solver benchmark.")
+    parser.add_argument('--batch-size', type=int, default=100000,
+                        help="The number of geometries per batch for the throughput of gthoi_solver_batch.")
+    parser.add_argument('--methods', nargs='+', choices=SOLVER_METHODS, default=list(SOLVER_METHODS),
+                        help="The solver methods to benchmark. ('sympy' takes by far the longest.)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="The seed for the geometries in the solver benchmark.")
+    parser.add_argument('--output', default=None,
+                        help="Also write the results to this JSON file.")
+    parser.add_argument('--compare', default=None, metavar='BASELINE_JSON',
+                        help="Compare the results of the solver benchmark with those of an earlier run (written with "
+                             "--output), and exit with an error if anything has regressed.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_REGRESSION_TOLERANCE,
+                        help="The fraction by which a result has to be worse than the baseline to count as a "
+                             "regression with --compare.")
+    args = parser.parse_args()
+
+    results = {'benchmark': args.benchmark, 'python': sys.version.split()[0], 'numpy': np.__version__}
+    if args.benchmark == 'startup':
+        results['timings'] = benchmark_startup(args.config_file, n_runs=args.runs)
+        _print_timings(f"Startup (median of {args.runs} runs):", results['timings'])
+    elif args.benchmark == 'solver':
+        results['solver'] = benchmark_solver(n_geometries=args.geometries, n_hard=args.hard,
+                                             batch_size=args.batch_size, seed=args.seed, methods=args.methods)
+        _print_solver_results(results['solver'])
+
+    if args.output:
+        with open(args.output, mode="w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+    if args.compare and args.benchmark == 'solver':
+        with open(args.compare, mode="r") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_solver_results(results['solver'], baseline['solver'], tolerance=args.tolerance)
+        if regressions:
+            print(f"Regressions vs. {args.compare}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            raise SystemExit(1)
+        print(f"No regressions vs. {args.compare}.")
@@ -0,0 +1,471 @@
+# NL: An extended model of the system, for when the quartic's idealisations matter: the shoulder is a circle of radius
+#   shoulder_radius rather than a point, which the strap wraps around, and there's static friction between the strap
+#   and the shoulder, with coefficient strap_friction. With both at zero, this is exactly the model of gthoi_solver.py.
+# Friction means that the tensions on either side of the shoulder don't have to be equal: by the capstan equation, the
+#   strap doesn't slip as long as their ratio is within exp(+/-strap_friction * wrap), where wrap is the angle the strap
+#   turns through over the shoulder. So instead of a single equilibrium, the guitar stays put anywhere in a range of
+#   angles, whose ends are where the strap is just about to slip one way or the other. The solution the solvers here
+#   return is the one with equal tensions (i.e. where the guitar settles if the strap slides freely), along with that
+#   range.
+# That free-sliding solution doesn't depend on strap_friction at all, which only sets how far the range reaches either
+#   side of it. So where only one angle per geometry is wanted (the map, the inverse problem and the uncertainty), it's
+#   the free-sliding one, and the friction is left out.
+# There's no closed form for any of this, so it's solved numerically, by Newton's method, in six variables:
+#   guitar_angle, the x and y of the centre of the shoulder, the angles of the strap at the left and right buttons,
+#   and k, the log of the ratio of the tensions per unit of wrap (so the strap holds as long as |k| <= strap_friction).
+#   There are only five equations, so one of the variables is always held fixed:
+# - The solution with equal tensions (k = 0) is warm-started from the solution of the quartic (which is the answer for
+#   a point shoulder), and then followed as the shoulder radius is brought in, by continuation, with a step that adapts
+#   as it goes (usually, it gets there in one step).
+# - From there, guitar_angle is stepped outwards in both directions, solving for the k that holds the guitar at each
+#   angle, until |k| reaches strap_friction, with a step that adapts in the same way. Each end of the range is then
+#   pinned down by solving with k held at +/-strap_friction. (Stepping k up to strap_friction instead would be
+#   simpler, but guitar_angle can change very fast with k towards the ends, which it would have to creep through.)
+# - Given the solution of a nearby geometry (e.g. the last frame of live mode in get_the_hang_of_it.py), both of those
+#   are first tried by Newton's method straight from its solution, which is usually all it takes, and they fall back
+#   to the above for the rows where that doesn't converge (or where a nearer end of the range has turned up).
+# It's all vectorised, so a whole sweep is solved in one go.
+# The coordinates are those of the derivation in readme.md: the C.O.M. is at the origin, with y pointing up, the left
+#   button at (-g_1*cos(guitar_angle), g_1*sin(guitar_angle)), and the right button at (-g_2*cos(phi), g_2*sin(phi)),
+#   with phi = theta_COM + guitar_angle. The strap leaves the left button at an angle a_L above the horizontal, towards
+#   the right, and the right button at a_R, towards the left, and touches the shoulder from the tangent points on.
+# Run this file to solve a config file with the extended model, e.g.
+#   python gthoi_extended.py config/config.json --shoulder-radius 5 --strap-friction 0.4
+
+import argparse
+import json
+
+import numpy as np
+
+import gthoi_profiling
+from gthoi_solver import (BATCH_RESULT_DTYPE, RESIDUAL_RTOL, STATUS_OK, STATUS_RESIDUAL, gthoi_solver,
+                          gthoi_solver_batch)
+
+
+# The shoulder radius is brought in by continuation, with a step size for each row that adapts as it goes: it starts
+#   by trying to get there in one step, and the step is halved whenever one fails, and doubled whenever one succeeds. A
+#   row is given up on once the step would be less than this fraction of the way.
+MIN_CONTINUATION_STEP = 1 / 64
+
+# The first step in guitar_angle, in radians, when stepping out to the ends of the range that friction allows. It
+#   adapts as it goes, as for the shoulder radius, but no further than the maximum (so as not to step right over an
+#   end), and a row is given up on once it would be less than the minimum.
+RANGE_ANGLE_STEP = 0.1
+MIN_RANGE_ANGLE_STEP = 0.1 / 64
+MAX_RANGE_ANGLE_STEP = 0.2
+
+# The most Newton steps taken for each solve. It usually takes two or three.
+MAX_NEWTON_ITER = 8
+
+# The structured array returned by gthoi_solver_extended_batch: as BATCH_RESULT_DTYPE, plus 'guitar_angle_range', the
+#   smallest and largest guitar_angle that friction can hold the guitar at (NaN wherever status isn't STATUS_OK). An end
+#   of the range is also NaN if friction would hold the guitar as far as vertical, where the model no longer applies
+#   (the buttons would swap sides), or if the solution can't be followed that far.
+# 'state' is the variables x (see below) of the solution with the strap sliding freely, and of the low and high ends
+#   of the range, in that order (NaN where they weren't found), for warm-starting a later solve from.
+EXTENDED_RESULT_DTYPE = np.dtype(BATCH_RESULT_DTYPE.descr + [('guitar_angle_range', np.float64, (2,)),
+                                                             ('state', np.float64, (3, 6))])
+
+# The variables of the model are x = (guitar_angle, s_x, s_y, a_L, a_R, k) (see above). These are the indices of the
+#   ones that are solved for (in x, and in the derivatives from _shoulder_equations), with k held fixed, and with
+#   guitar_angle held fixed.
+_K_FIXED = ([0, 1, 2, 3, 4], [0, 1, 2, 3, 4])
+_ANGLE_FIXED = ([1, 2, 3, 4, 5], [1, 2, 3, 4, 6])
+
+
+def _shoulder_equations(x, g_1, g_2, theta_COM, L, R):
+    """The residuals F (..., 5) of the equations of the extended model at x (..., 6), and their derivatives J
+    (..., 5, 7): by guitar_angle, s_x, s_y, a_L, a_R, R (the shoulder radius) and k, in that order. Also returns the
+    lengths of the straight segments of the strap."""
+    theta_g, s_x, s_y, a_L, a_R, k = np.moveaxis(x, -1, 0)
+    phi = theta_COM + theta_g
+    c_L, s_L, c_R, s_R = np.cos(a_L), np.sin(a_L), np.cos(a_R), np.sin(a_R)
+    # The buttons, and their derivatives by theta_g:
+    B_Lx, B_Ly = -g_1*np.cos(theta_g), g_1*np.sin(theta_g)
+    B_Rx, B_Ry = -g_2*np.cos(phi), g_2*np.sin(phi)
+    dB_Lx, dB_Ly = g_1*np.sin(theta_g), g_1*np.cos(theta_g)
+    dB_Rx, dB_Ry = g_2*np.sin(phi), g_2*np.cos(phi)
+    D_Lx, D_Ly = s_x - B_Lx, s_y - B_Ly
+    D_Rx, D_Ry = s_x - B_Rx, s_y - B_Ry
+    # Along each straight segment of the strap, the direction from the button towards the shoulder is u_L = (c_L, s_L)
+    #   or u_R = (-c_R, s_R), and the shoulder is on the side of n_L = (s_L, -c_L) or n_R = (-s_R, -c_R). So the
+    #   distances of the centre of the shoulder from the lines of the segments (which are R for tangents) are:
+    dist_L = D_Lx*s_L - D_Ly*c_L
+    dist_R = -D_Rx*s_R - D_Ry*c_R
+    # And the lengths of the segments, from the buttons to the tangent points:
+    t_L = D_Lx*c_L + D_Ly*s_L
+    t_R = -D_Rx*c_R + D_Ry*s_R
+    # The strap turns through wrap = a_L + a_R over the shoulder. The tensions pull the guitar along u_L and u_R, with
+    #   the one on the right rho times the one on the left, and their moments about the C.O.M. (per unit tension) are:
+    wrap = a_L + a_R
+    rho = np.exp(k*wrap)
+    torque_L = B_Lx*s_L - B_Ly*c_L
+    torque_R = B_Rx*s_R + B_Ry*c_R
+
+    # The constraints, as F = 0: the two segments are tangent to the shoulder (F_1, F_2), the strap is L long (F_3),
+    #   and the forces (F_4, horizontally, as the vertical one just gives the total tension) and the moments (F_5) on
+    #   the guitar balance.
+    F = np.stack([dist_L - R,
+                  dist_R - R,
+                  t_L + t_R + R*wrap - L,
+                  c_L - rho*c_R,
+                  torque_L + rho*torque_R], axis=-1)
+    # (Anything not set here is zero.)
+    J = np.zeros(F.shape + (7,))
+    J[..., 0, :] = np.stack(np.broadcast_arrays(-(dB_Lx*s_L - dB_Ly*c_L), s_L, -c_L, t_L, 0.0, -1.0, 0.0), axis=-1)
+    J[..., 1, :] = np.stack(np.broadcast_arrays(dB_Rx*s_R + dB_Ry*c_R, -s_R, -c_R, 0.0, t_R, -1.0, 0.0), axis=-1)
+    J[..., 2, :] = np.stack(np.broadcast_arrays(-(dB_Lx*c_L + dB_Ly*s_L) + dB_Rx*c_R - dB_Ry*s_R, c_L - c_R, s_L + s_R,
+                                                R - dist_L, R - dist_R, wrap, 0.0), axis=-1)
+    J[..., 3, 3] = -s_L - k*rho*c_R
+    J[..., 3, 4] = rho*s_R - k*rho*c_R
+    J[..., 3, 6] = -wrap*rho*c_R
+    J[..., 4, 0] = dB_Lx*s_L - dB_Ly*c_L + rho*(dB_Rx*s_R + dB_Ry*c_R)
+    J[..., 4, 3] = B_Lx*c_L + B_Ly*s_L + k*rho*torque_R
+    J[..., 4, 4] = rho*(B_Rx*c_R - B_Ry*s_R) + k*rho*torque_R
+    J[..., 4, 6] = wrap*rho*torque_R
+    return F, J, t_L, t_R
+
+
+def _converged(F, L):
+    # Everything but the balance of horizontal forces is a length (or a moment per unit tension), so it's measured
+    #   against the strap length, as in gthoi_solver's final check.
+    scale = np.stack(np.broadcast_arrays(L, L, L, np.ones_like(L), L), axis=-1)
+    return np.all(np.abs(F) < RESIDUAL_RTOL * scale, axis=-1)
+
+
+def _valid(x, t_L, t_R):
+    # The straight segments of the strap have positive lengths, it pulls upwards on both buttons, and the guitar hasn't
+    #   turned past vertical.
+    theta_g, _, _, a_L, a_R, _ = np.moveaxis(x, -1, 0)
+    with np.errstate(invalid='ignore'):
+        return ((t_L > 0) & (t_R > 0) & (a_L > 0) & (a_L < np.pi) & (a_R > 0) & (a_R < np.pi) &
+                (np.abs(theta_g) <= np.pi / 2))
+
+
+def _solve(A, b):
+    try:
+        return np.linalg.solve(A, b[..., np.newaxis])[..., 0]
+    except np.linalg.LinAlgError:
+        # One of the matrices is exactly singular, which stops the whole stack from solving. That row is given up on
+        #   (with NaNs), and the rest are solved without it.
+        with np.errstate(over='ignore', invalid='ignore'):
+            singular = ~(np.abs(np.linalg.det(A)) > 0)
+        A = np.where(singular[..., np.newaxis, np.newaxis], np.eye(A.shape[-1]), A)
+        return np.where(singular[..., np.newaxis], np.nan, np.linalg.solve(A, b[..., np.newaxis])[..., 0])
+
+
+def _newton(x, unknowns, g_1, g_2, theta_COM, L, R):
+    """Refines x by Newton's method in the unknowns (_K_FIXED or _ANGLE_FIXED). Returns it, whether each row has
+    converged to a valid solution, and the derivatives from _shoulder_equations there."""
+    x = x.copy()
+    x_index, J_index = unknowns
+    J_end = np.full(x.shape[:-1] + (5, 7), np.nan)
+    ok = np.zeros(x.shape[0], dtype=bool)
+    # Only the rows that are still going are worked on, so a few slow ones don't hold up the rest.
+    rows = np.arange(x.shape[0])
+    for i in range(MAX_NEWTON_ITER + 1):
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            F, J, t_L, t_R = _shoulder_equations(x[rows], g_1[rows], g_2[rows], theta_COM[rows], L[rows], R[rows])
+        done = _converged(F, L[rows])
+        ok[rows[done]] = _valid(x[rows[done]], t_L[done], t_R[done])
+        J_end[rows[done]] = J[done]
+        # Rows that have gone off to infinity are given up on.
+        going = ~done & np.all(np.isfinite(F), axis=-1) & np.all(np.isfinite(J), axis=(-2, -1))
+        rows, F, J = rows[going], F[going], J[going]
+        if not rows.size or i == MAX_NEWTON_ITER:
+            break
+        x[rows[:, np.newaxis], x_index] -= _solve(J[..., J_index], F)
+    return x, ok, J_end
+
+
+def _predict(x, J, unknowns, change, J_column):
+    """The first-order prediction of x (..., 6) after a change in the variable whose derivatives are J[..., J_column],
+    with the unknowns following along."""
+    x_index, J_index = unknowns
+    x = x.copy()
+    with np.errstate(invalid='ignore'):
+        x[:, x_index] -= _solve(J[..., J_index], J[..., J_column] * change[:, np.newaxis])
+    return x
+
+
+def _shoulder_continuation(x, g_1, g_2, theta_COM, L, R):
+    """Follows the solution x with k fixed, and a point shoulder, to a shoulder of radius R. Returns it, and whether
+    each row got there."""
+    zeros = np.zeros_like(R)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        _, J, _, _ = _shoulder_equations(x, g_1, g_2, theta_COM, L, zeros)
+    x = x.copy()
+    # How far each row has got (as a fraction of the way), and the size of its next step:
+    done = np.zeros(x.shape[0])
+    step = np.ones(x.shape[0])
+    ok = np.zeros(x.shape[0], dtype=bool)
+    rows = np.arange(x.shape[0])
+    while rows.size:
+        to = np.minimum(done[rows] + step[rows], 1.0)
+        predicted = _predict(x[rows], J[rows], _K_FIXED, R[rows] * (to - done[rows]), 5)
+        x_rows, converged, J_rows = _newton(predicted, _K_FIXED, g_1[rows], g_2[rows], theta_COM[rows], L[rows],
+                                            R[rows] * to)
+        moved = rows[converged]
+        x[moved], J[moved], done[moved] = x_rows[converged], J_rows[converged], to[converged]
+        step[rows] = np.where(converged, 2 * step[rows], step[rows] / 2)
+        ok[moved[done[moved] >= 1.0]] = True
+        rows = rows[(done[rows] < 1.0) & (step[rows] >= MIN_CONTINUATION_STEP)]
+    return np.where(ok[:, np.newaxis], x, np.nan), ok
+
+
+def _range_ends(x, direction, g_1, g_2, theta_COM, L, R, mu, guess=None):
+    """Steps guitar_angle out from the solution x (with k = 0) in direction (+1 or -1 for each row), until the friction
+    needed to hold it there reaches mu. Returns the guitar_angle there, or NaN if it can't be found (see
+    EXTENDED_RESULT_DTYPE), and the solution there.
+    guess is the solutions at the ends for a nearby geometry (NaN where there aren't any): each row is first solved
+    for with k held at mu straight from it, and only stepped out to if that doesn't converge on the right side of x,
+    with friction holding the guitar all the way out to it."""
+    ends = np.full(x.shape[0], np.nan)
+    x_ends = np.full(x.shape, np.nan)
+    rows = np.flatnonzero(np.all(np.isfinite(x), axis=-1))
+    if guess is not None:
+        warm = rows[np.all(np.isfinite(guess[rows]), axis=-1)]
+        start = guess[warm].copy()
+        start[:, 5] = np.sign(start[:, 5]) * mu[warm]
+        x_warm, ok, _ = _newton(start, _K_FIXED, g_1[warm], g_2[warm], theta_COM[warm], L[warm], R[warm])
+        ok &= direction[warm] * (x_warm[:, 0] - x[warm, 0]) > 0
+        warm, x_warm = warm[ok], x_warm[ok]
+        # It's only the end if friction holds the guitar all the way out to it, though: a nearer one can turn up as the
+        #   geometry changes. That's checked at the angles that stepping out below would get to if every step
+        #   converged, from the straight line between the two solutions.
+        span = np.abs(x_warm[:, 0] - x[warm, 0])
+        n_steps = np.maximum(np.ceil((span - RANGE_ANGLE_STEP) / MAX_RANGE_ANGLE_STEP), 0).astype(int)
+        owner = np.repeat(np.arange(warm.size), n_steps)
+        step_index = np.arange(owner.size) - np.repeat(np.cumsum(n_steps) - n_steps, n_steps)
+        fraction = (RANGE_ANGLE_STEP + step_index * MAX_RANGE_ANGLE_STEP) / span[owner]
+        between = x[warm[owner]] + fraction[:, np.newaxis] * (x_warm[owner] - x[warm[owner]])
+        x_between, held, _ = _newton(between, _ANGLE_FIXED, *(v[warm[owner]] for v in (g_1, g_2, theta_COM, L, R)))
+        with np.errstate(invalid='ignore'):
+            held &= np.abs(x_between[:, 5]) < mu[warm[owner]]
+        ok = np.ones(warm.size, dtype=bool)
+        ok[owner[~held]] = False
+        ends[warm[ok]], x_ends[warm[ok]] = x_warm[ok, 0], x_warm[ok]
+        rows = np.setdiff1d(rows, warm[ok])
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        _, J, _, _ = _shoulder_equations(x, g_1, g_2, theta_COM, L, R)
+    x = x.copy()
+    step = np.full(x.shape[0], RANGE_ANGLE_STEP)
+    while rows.size:
+        # (No further than vertical, where a row that hasn't reached mu yet stops.)
+        to = np.clip(x[rows, 0] + direction[rows] * step[rows], -np.pi / 2, np.pi / 2)
+        predicted = _predict(x[rows], J[rows], _ANGLE_FIXED, to - x[rows, 0], 0)
+        predicted[:, 0] = to
+        x_rows, ok, J_rows = _newton(predicted, _ANGLE_FIXED, g_1[rows], g_2[rows], theta_COM[rows], L[rows],
+                                     R[rows])
+        # Where |k| has got to mu, the end is between the last step and this one. It's interpolated, and then solved for
+        #   with k held there. (If that doesn't converge between the two, the interpolation will do.)
+        with np.errstate(invalid='ignore'):
+            crossed = ok & (np.abs(x_rows[:, 5]) >= mu[rows])
+        if np.any(crossed):
+            crossed_rows = rows[crossed]
+            before, after = x[crossed_rows], x_rows[crossed]
+            k_end = np.sign(after[:, 5]) * mu[crossed_rows]
+            fraction = (k_end - before[:, 5]) / (after[:, 5] - before[:, 5])
+            guess = before + fraction[:, np.newaxis] * (after - before)
+            guess[:, 5] = k_end
+            x_end, ok_end, _ = _newton(guess, _K_FIXED, g_1[crossed_rows], g_2[crossed_rows], theta_COM[crossed_rows],
+                                       L[crossed_rows], R[crossed_rows])
+            ok_end &= (x_end[:, 0] - before[:, 0]) * (x_end[:, 0] - after[:, 0]) <= 0
+            x_ends[crossed_rows] = np.where(ok_end[:, np.newaxis], x_end, guess)
+            ends[crossed_rows] = x_ends[crossed_rows, 0]
+        x[rows[ok]], J[rows[ok]] = x_rows[ok], J_rows[ok]
+        # As in _shoulder_continuation, the step doubles after a success and halves after a failure.
+        step[rows] = np.where(ok, np.minimum(2 * step[rows], MAX_RANGE_ANGLE_STEP), step[rows] / 2)
+        rows = rows[~crossed & (np.abs(x[rows, 0]) < np.pi / 2) & (step[rows] >= MIN_RANGE_ANGLE_STEP)]
+    return ends, x_ends
+
+
+def gthoi_solver_extended_batch(g_1, g_2, theta_COM, L, shoulder_radius=0.0, strap_friction=0.0, base=None,
+                                guess=None):
+    """Solves the extended model for arrays of geometries, like gthoi_solver_batch.
+
+    The first four arguments are as for gthoi_solver_batch, and shoulder_radius (in the units of L) and strap_friction
+    (the coefficient of static friction) can vary along with them. All of them are broadcast together, and the result
+    is a structured array of that shape with EXTENDED_RESULT_DTYPE. The values have the same meanings as for
+    gthoi_solver_batch, for the strap sliding freely over the shoulder (left_strap_seg_len is up to where the strap
+    meets the shoulder), and 'guitar_angle_range' is the range of guitar_angle that friction can hold the guitar at.
+    base is the result of gthoi_solver_batch for the same geometries, if it's already been worked out: each solve is
+    started from it. A row that's stable in the quartic's model, but that doesn't converge here (e.g. because the
+    shoulder is too big to fit the strap around), gets STATUS_RESIDUAL.
+    guess is the 'state' of an earlier result for nearby geometries (e.g. the last frame of live mode), broadcast
+    against the rest, to warm-start each solve from instead, where it converges."""
+    timer = gthoi_profiling.stage_timer('gthoi_solver_extended_batch')
+    g_1, g_2, theta_COM, L, R, mu = (np.asarray(x, dtype=float) for x in
+                                     np.broadcast_arrays(g_1, g_2, theta_COM, L, shoulder_radius, strap_friction))
+    shape = g_1.shape
+    if base is None:
+        base = gthoi_solver_batch(g_1, g_2, theta_COM, L)
+    base = np.broadcast_to(base, shape).ravel()
+    g_1, g_2, theta_COM, L, R, mu = (x.ravel() for x in (g_1, g_2, theta_COM, L, R, mu))
+    if guess is not None:
+        guess = np.broadcast_to(guess, shape + (3, 6)).reshape(-1, 3, 6)
+
+    result = np.empty(g_1.size, dtype=EXTENDED_RESULT_DTYPE)
+    for name in BATCH_RESULT_DTYPE.names:
+        result[name] = base[name]
+    result['guitar_angle_range'] = base['guitar_angle'][:, np.newaxis]
+    result['state'] = np.nan
+    if timer:
+        timer.lap('quartic')
+
+    # The warm start: the quartic's solution, with the shoulder at the point where the strap bends.
+    rows = np.flatnonzero(base['status'] == STATUS_OK)
+    g_1, g_2, theta_COM, L, R, mu = (x[rows] for x in (g_1, g_2, theta_COM, L, R, mu))
+    theta_g, l, theta_s = (base[name][rows] for name in ('guitar_angle', 'left_strap_seg_len', 'strap_angle'))
+    x = np.stack([theta_g, -g_1*np.cos(theta_g) + l*np.cos(theta_s), g_1*np.sin(theta_g) + l*np.sin(theta_s),
+                  theta_s, theta_s, np.zeros_like(theta_g)], axis=-1)
+    ok = np.ones(rows.size, dtype=bool)
+    shoulder = np.flatnonzero(R != 0)
+    if guess is not None:
+        guess = guess[rows]
+        warm = shoulder[np.all(np.isfinite(guess[shoulder, 0]), axis=-1)]
+        start = guess[warm, 0].copy()
+        start[:, 5] = 0.0
+        x_warm, ok_warm, _ = _newton(start, _K_FIXED, *(v[warm] for v in (g_1, g_2, theta_COM, L, R)))
+        x[warm[ok_warm]] = x_warm[ok_warm]
+        shoulder = np.setdiff1d(shoulder, warm[ok_warm])
+    if shoulder.size:
+        x[shoulder], ok[shoulder] = _shoulder_continuation(x[shoulder], *(v[shoulder] for v in
+                                                                          (g_1, g_2, theta_COM, L, R)))
+    if timer:
+        timer.lap('shoulder')
+
+    # Then both ends of the range, at once.
+    low = high = x[:, 0]
+    x_ends = np.full((rows.size, 2, 6), np.nan)
+    friction = np.flatnonzero(ok & (mu != 0))
+    if friction.size:
+        ends, x_found = _range_ends(
+            np.concatenate([x[friction]] * 2), np.repeat([-1.0, 1.0], friction.size),
+            *(np.tile(v[friction], 2) for v in (g_1, g_2, theta_COM, L, R, mu)),
+            guess=None if guess is None else np.concatenate([guess[friction, 1], guess[friction, 2]]))
+        low, high = low.copy(), high.copy()
+        low[friction], high[friction] = ends.reshape(2, -1)
+        x_ends[friction] = x_found.reshape(2, -1, 6).swapaxes(0, 1)
+    if timer:
+        timer.lap('friction')
+
+    a_L = x[:, 3]
+    t_L = (x[:, 1] + g_1*np.cos(x[:, 0]))*np.cos(a_L) + (x[:, 2] - g_1*np.sin(x[:, 0]))*np.sin(a_L)
+    result['guitar_angle'][rows] = np.where(ok, x[:, 0], np.nan)
+    result['left_strap_seg_len'][rows] = np.where(ok, t_L, np.nan)
+    result['strap_angle'][rows] = np.where(ok, a_L, np.nan)
+    result['guitar_angle_range'][rows] = np.where(ok[:, np.newaxis], np.stack([low, high], axis=-1), np.nan)
+    result['state'][rows] = np.where(ok[:, np.newaxis, np.newaxis], np.concatenate([x[:, np.newaxis], x_ends], axis=1),
+                                     np.nan)
+    result['status'][rows] = np.where(ok, STATUS_OK, STATUS_RESIDUAL)
+    result['stable'] = result['status'] == STATUS_OK
+    if timer:
+        gthoi_profiling.count('gthoi_solver_extended_batch.solves', result.size)
+        gthoi_profiling.count('gthoi_solver_extended_batch.unconverged', int(np.count_nonzero(~ok)))
+        gthoi_profiling.count('gthoi_solver_extended_batch.open_ranges',
+                              int(np.count_nonzero(ok & np.isnan(low + high))))
+    return result.reshape(shape)
+
+
+def gthoi_solver_extended(g_1, g_2, theta_COM, L, shoulder_radius=0.0, strap_friction=0.0, base_res=None,
+                          state_guess=None):
+    """Solves the extended model for a single geometry, returning a result_dict as gthoi_solver does, plus
+    'guitar_angle_range' and 'extended_state' (the 'guitar_angle_range' and 'state' of gthoi_solver_extended_batch:
+    see EXTENDED_RESULT_DTYPE). base_res is the result of one of the solvers in gthoi_solver.py for the same geometry,
+    if it's already been worked out. state_guess is the 'extended_state' of an earlier solve of a nearby geometry, to
+    warm-start from. Returns {} if the design is unstable, or if the extended model doesn't converge."""
+    if base_res is None:
+        base_res = gthoi_solver(g_1, g_2, theta_COM, L)
+    if not base_res:
+        return {}
+    base = np.array((base_res['guitar_angle'], base_res['left_strap_seg_len'], base_res['strap_angle'], True,
+                     STATUS_OK), dtype=BATCH_RESULT_DTYPE)
+    row = gthoi_solver_extended_batch(g_1, g_2, theta_COM, L, shoulder_radius, strap_friction, base=base,
+                                      guess=state_guess)[()]
+    if row['status'] != STATUS_OK:
+        return {}
+    return {'guitar_angle': float(row['guitar_angle']),
+            'left_strap_seg_len': float(row['left_strap_seg_len']),
+            'strap_angle': float(row['strap_angle']),
+            'guitar_angle_range': tuple(row['guitar_angle_range'].tolist()),
+            'extended_state': row['state'].copy()}
+
+
+def gthoi_solver_extended_gradient(g_1, g_2, theta_COM, L, shoulder_radius, rel_step=1e-6):
+    """The derivatives of guitar_angle (for the strap sliding freely) in the extended model with respect to g_1, g_2,
+    theta_COM and L, in that order, for a single geometry, like the first row of gthoi_solver.gthoi_solver_gradient.
+
+    They're found by central differences, with each input changed by rel_step of its value, as all eight of the solves
+    that takes go in a single call to gthoi_solver_extended_batch. They're NaN if any of those doesn't converge."""
+    inputs = np.array([g_1, g_2, theta_COM, L], dtype=float)
+    step = rel_step * np.abs(inputs)
+    perturbed = inputs + np.concatenate([np.diag(step), -np.diag(step)])
+    angles = gthoi_solver_extended_batch(*perturbed.T, shoulder_radius)['guitar_angle']
+    return (angles[:4] - angles[4:]) / (2 * step)
+
+
+if __name__ == '__main__':
+    import time
+
+    from gthoi_geometry import (button_distance, config_equilibrium, config_extended_model, config_marker_centres,
+                                config_real_to_pixel_dist_ratio)
+    from gthoi_solver import random_geometries
+    from gthoi_worker import range_text
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config_file', nargs='?', default='config/config.json',
+                        help="The config file to solve.")
+    parser.add_argument('--shoulder-radius', type=float, default=None,
+                        help="The radius of the shoulder, in the units of the strap length. Defaults to the config "
+                             "file's shoulder_radius, if it has one, and otherwise 0.")
+    parser.add_argument('--strap-friction', type=float, default=None,
+                        help="The coefficient of static friction between the strap and the shoulder. Defaults to the "
+                             "config file's strap_friction, if it has one, and otherwise 0.")
+    parser.add_argument('--sweep', type=int, default=0, metavar='N',
+                        help="Also time a sweep of N random geometries, with the same shoulder radius (relative to the "
+                             "distance between the buttons as in the config file) and friction.")
+    args = parser.parse_args()
+
+    with open(args.config_file, mode="r") as config_file:
+        configs = json.load(config_file)
+    shoulder_radius, strap_friction = config_extended_model(configs)
+    if args.shoulder_radius is not None:
+        configs['shoulder_radius'] = shoulder_radius = args.shoulder_radius
+    if args.strap_friction is not None:
+        configs['strap_friction'] = strap_friction = args.strap_friction
+
+    deg = 180 / np.pi
+    point_res = config_equilibrium({**configs, 'shoulder_radius': 0.0, 'strap_friction': 0.0})
+    res = config_equilibrium(configs)
+    if point_res is None:
+        print("The strap is too short to reach between the buttons.")
+    elif not point_res:
+        print("Unstable design.")
+    else:
+        print(f"With a point shoulder and no friction: {point_res['total_rot'] * deg:.2f} degrees clockwise vs. the "
+              f"horizontal.")
+        if not res:
+            print(f"With a shoulder radius of {shoulder_radius:g} and strap friction of {strap_friction:g}, the "
+                  f"extended model doesn't converge.")
+        else:
+            message = (f"With a shoulder radius of {shoulder_radius:g} and strap friction of {strap_friction:g}: "
+                       f"{res['total_rot'] * deg:.2f} degrees if the strap slides freely")
+            if strap_friction:
+                message += f", and anywhere from {range_text(res)} with friction"
+            print(f"{message}.")
+
+    if args.sweep:
+        geometries = random_geometries(args.sweep, np.random.default_rng(0))
+        g_3 = np.sqrt(geometries[0]**2 + geometries[1]**2 - 2*geometries[0]*geometries[1]*np.cos(geometries[2]))
+        B1_centre, _, B2_centre = config_marker_centres(configs)
+        config_g_3 = button_distance(B1_centre, B2_centre, config_real_to_pixel_dist_ratio(configs))
+        start = time.perf_counter()
+        base = gthoi_solver_batch(*geometries)
+        quartic_time = time.perf_counter() - start
+        sweep = gthoi_solver_extended_batch(*geometries, shoulder_radius * g_3 / config_g_3, strap_friction,
+                                            base=base)
+        extended_time = time.perf_counter() - start - quartic_time
+        n_ok = int(np.count_nonzero(sweep['stable']))
+        print(f"Swept {args.sweep} random geometries: the quartic took {quartic_time:.3f} s, and the extended model "
+              f"{extended_time:.3f} s more ({n_ok} converged, of {int(np.count_nonzero(base['stable']))} stable).")
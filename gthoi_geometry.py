@@ -0,0 +1,197 @@
+# NL: This converts between the marker positions in the image, as seen in get_the_hang_of_it.py, and the parameters in
+#   terms of which gthoi_solver.py defines the system, and back again.
+# None of this depends on pygame: marker centres are just pixel coordinates (x, y), with y pointing down the image.
+# Config files (and get_the_hang_of_it.py, whenever the window is resized) keep the marker positions in image
+#   coordinates instead: (x, y) as fractions of the longest side of the image, so that they're the same whatever size
+#   the image is shown at. Likewise, the length calibration is kept as the real length of the longest side of the image.
+#   Older config files have the marker positions in pixels at max_dim, and the real length of a pixel at that size,
+#   which are converted.
+# A config file can also choose the extended model of gthoi_extended.py, with a shoulder of finite radius and friction
+#   between it and the strap, with the optional "shoulder_radius" (in the units of the strap length) and
+#   "strap_friction" (the coefficient of static friction). Without them, the shoulder is a frictionless point, as in
+#   gthoi_solver.py.
+
+import numpy as np
+
+import gthoi_profiling
+from gthoi_extended import gthoi_solver_extended
+from gthoi_solver import gthoi_solver, gthoi_solver_warm
+
+
+# The names of the markers, in the bespoke order used everywhere.
+MARKER_NAMES = ('B1', 'COM', 'B2')
+
+# The number of straight pieces that the strap is drawn with around a shoulder of finite radius (see strap_pixel_path).
+SHOULDER_ARC_SEGMENTS = 12
+
+
+# Workaround for NumPy's annoying deprecation:
+def cross2d(x, y):
+    return x[..., 0] * y[..., 1] - x[..., 1] * y[..., 0]
+
+
+def solver_inputs(B1_centre, COM_centre, B2_centre):
+    """Returns (g_1, g_2, theta_COM, pre_rot, B1_is_left) for markers at the given pixel centres.
+
+    g_1 and g_2 are in pixels. B1_is_left says whether B1 is the button that plays the role of the left/bottom button
+    in the solver (and so whether g_1 belongs to B1). The centres can be arrays of shape (..., 2), in which case all of
+    the results have the shape (...)."""
+    # We need to get the angle theta_COM between the two vectors that the buttons define vs. the COM, and we need to
+    #   compute the (left-handed) pre-rotation that places the system into the state in terms of which the solver is
+    #   defined.
+    # We are using clockwise-positive/left-handed conventions for our angles, as decided offline. This is the simplest
+    #   way of expressing things given our choices in the original derivation:
+    v1 = np.asarray(B1_centre, dtype=float) - np.asarray(COM_centre, dtype=float)
+    v2 = np.asarray(B2_centre, dtype=float) - np.asarray(COM_centre, dtype=float)
+    # And then we have to correct for the Original Sin of graphics and get positive y pointing upwards like it's
+    #   supposed to:
+    v1[..., 1] = -v1[..., 1]
+    v2[..., 1] = -v2[..., 1]
+
+    reference_ax = np.array([-1.0, 0.0])
+    theta_v2_v1 = np.arctan2(cross2d(v2, v1), np.sum(v1 * v2, axis=-1))
+    # If theta_v2_v1 >= 0, the vector that will be rotated clockwise to (-1, 0) is v1, and otherwise, it's v2:
+    B1_is_left = theta_v2_v1 >= 0
+    v_left = np.where(B1_is_left[..., np.newaxis], v1, v2)
+    v_right = np.where(B1_is_left[..., np.newaxis], v2, v1)
+    theta_COM = np.abs(theta_v2_v1)
+    g_1 = np.linalg.norm(v_left, axis=-1)
+    g_2 = np.linalg.norm(v_right, axis=-1)
+    pre_rot = np.arctan2(cross2d(reference_ax, v_left), np.sum(v_left * reference_ax, axis=-1))
+    return g_1, g_2, theta_COM, pre_rot, B1_is_left
+
+
+def marker_centre(init_pixel_coords, marker_size):
+    """The pixel centre of a marker that get_the_hang_of_it.py has placed at init_pixel_coords.
+
+    pygame truncates the top left corner of the marker's rect to whole pixels, so the centre can be up to a pixel away
+    from init_pixel_coords when that isn't whole numbers itself. This reproduces that without needing pygame."""
+    return tuple(int(c - marker_size/2.0) + int(marker_size) // 2 for c in init_pixel_coords)
+
+
+def image_to_pixel(image_coords, image_dim):
+    """Converts image coordinates to pixel coordinates, for the image shown with its longest side image_dim pixels."""
+    # (Rounded, so that whole pixels converted there and back again stay whole, whatever the round-off.)
+    return tuple(round(c * image_dim, 9) for c in image_coords)
+
+
+def pixel_to_image(pixel_coords, image_dim):
+    """Converts pixel coordinates to image coordinates, for the image shown with its longest side image_dim pixels."""
+    return tuple(c / image_dim for c in pixel_coords)
+
+
+def config_image_coords(configs):
+    """Returns the image coordinates of B1, COM and B2, and real_to_image_dist_ratio (the real length of the longest
+    side of the image), from configs (a loaded config file), in either format."""
+    if 'init_real_to_image_dist_ratio' in configs:
+        return (tuple(tuple(configs[f'{name}_init_image_coords']) for name in MARKER_NAMES),
+                configs['init_real_to_image_dist_ratio'])
+    # An older config file, in pixels at max_dim:
+    max_dim = configs['max_dim']
+    return (tuple(pixel_to_image(configs[f'{name}_init_pixel_coords'], max_dim) for name in MARKER_NAMES),
+            configs['init_real_to_pixel_dist_ratio'] * max_dim)
+
+
+def config_marker_centres(configs, image_dim=None):
+    """The pixel positions of B1, COM and B2 that get_the_hang_of_it.py solves from, as loaded from configs (a loaded
+    config file), with the longest side of the image image_dim pixels (max_dim by default). (These aren't rounded to
+    whole pixels, as the centres of the markers it draws are: see marker_centre.)"""
+    image_dim = image_dim or configs['max_dim']
+    return tuple(image_to_pixel(image_coords, image_dim) for image_coords in config_image_coords(configs)[0])
+
+
+def config_real_to_pixel_dist_ratio(configs, image_dim=None):
+    """The real length of a pixel, from configs (a loaded config file), with the longest side of the image image_dim
+    pixels (max_dim by default)."""
+    return config_image_coords(configs)[1] / (image_dim or configs['max_dim'])
+
+
+def config_extended_model(configs):
+    """The shoulder radius and strap friction of the extended model, from configs (a loaded config file). Both are 0
+    (i.e. the model of gthoi_solver.py) unless it says otherwise."""
+    return configs.get('shoulder_radius', 0.0), configs.get('strap_friction', 0.0)
+
+
+def button_distance(B1_centre, B2_centre, real_to_pixel_dist_ratio):
+    """The distance between the strap buttons, in the real units of length."""
+    return (np.linalg.norm(np.asarray(B2_centre, dtype=float) - np.asarray(B1_centre, dtype=float), axis=-1) *
+            real_to_pixel_dist_ratio)
+
+
+def equilibrium(B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length, backend='numpy',
+                l_guess=None, table=None, shoulder_radius=0.0, strap_friction=0.0, state_guess=None):
+    """Solves the system for markers at the given pixel centres, as the 'h' key does in get_the_hang_of_it.py.
+
+    Returns the result_dict from gthoi_solver, with two more keys: 'total_rot', the equilibrium angle as a clockwise
+    rotation of the image, and 'B1_is_left', as returned by solver_inputs. Returns {} if the design is unstable.
+    If l_guess (a previous 'left_strap_seg_len') is given, the solve is warm-started from it by gthoi_solver_warm.
+    If table (an EquilibriumTable, from gthoi_table.py) is given, it's used instead of solving where it can be.
+    If shoulder_radius or strap_friction isn't 0, that solution is then carried over to the extended model by
+    gthoi_solver_extended, and the result also has 'guitar_angle_range' and 'extended_state', and the same range of
+    total_rot as 'total_rot_range'. That's warm-started from state_guess (a previous 'extended_state'), if given."""
+    timer = gthoi_profiling.stage_timer('equilibrium')
+    g_1, g_2, theta_COM, pre_rot, B1_is_left = solver_inputs(B1_centre, COM_centre, B2_centre)
+    if timer:
+        timer.lap('geometry')
+    # We'll put everything into "real" units of length, according to the current calibration, such that the left-side
+    #   strap length is returned in units consistent with the representation of the total strap length, as you'd
+    #   expect:
+    if table is not None:
+        all_res = table.solve(g_1 * real_to_pixel_dist_ratio, g_2 * real_to_pixel_dist_ratio, theta_COM, strap_length)
+    elif l_guess is None:
+        all_res = gthoi_solver(g_1 * real_to_pixel_dist_ratio, g_2 * real_to_pixel_dist_ratio, theta_COM, strap_length,
+                               backend=backend)
+    else:
+        all_res = gthoi_solver_warm(g_1 * real_to_pixel_dist_ratio, g_2 * real_to_pixel_dist_ratio, theta_COM,
+                                    strap_length, l_guess)
+    if timer:
+        timer.lap('solve')
+    if all_res and (shoulder_radius or strap_friction):
+        all_res = gthoi_solver_extended(g_1 * real_to_pixel_dist_ratio, g_2 * real_to_pixel_dist_ratio, theta_COM,
+                                        strap_length, shoulder_radius, strap_friction, base_res=all_res,
+                                        state_guess=state_guess)
+        if all_res:
+            all_res['total_rot_range'] = tuple(pre_rot + rot for rot in all_res['guitar_angle_range'])
+        if timer:
+            timer.lap('extended')
+    if all_res:
+        all_res['total_rot'] = pre_rot + all_res['guitar_angle']
+        all_res['B1_is_left'] = bool(B1_is_left)
+    return all_res
+
+
+def config_equilibrium(configs, backend='numpy', table=None):
+    """Solves the system exactly as set up in configs (a loaded config file), as with the 'h' key straight after loading
+    it in get_the_hang_of_it.py (including the extended model, if it chooses it). Returns None if the strap is too short
+    to reach between the buttons, and otherwise the same as equilibrium(), which table is passed on to."""
+    B1_centre, COM_centre, B2_centre = config_marker_centres(configs)
+    real_to_pixel_dist_ratio = config_real_to_pixel_dist_ratio(configs)
+    strap_length = configs['init_strap_length']
+    shoulder_radius, strap_friction = config_extended_model(configs)
+    if button_distance(B1_centre, B2_centre, real_to_pixel_dist_ratio) > strap_length:
+        return None
+    return equilibrium(B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length, backend=backend,
+                       table=table, shoulder_radius=shoulder_radius, strap_friction=strap_friction)
+
+
+def strap_pixel_path(B1_centre, B2_centre, all_res, real_to_pixel_dist_ratio, shoulder_radius=0.0):
+    """Returns the pixel coordinates of the left button, the shoulder point S and the right button, in that order, for a
+    result from equilibrium(). This is the strap as it would sit on the guitar image, left unrotated.
+    With a shoulder of finite radius (for a result from the extended model), S is where the strap meets the shoulder on
+    the left, and it's followed by points around the shoulder to where it leaves on the right."""
+    B_left, B_right = (B1_centre, B2_centre) if all_res['B1_is_left'] else (B2_centre, B1_centre)
+    # Each strap segment is at strap_angle above the horizontal once the guitar has been rotated clockwise by
+    #   total_rot, so relative to the image, the left segment is at (strap_angle + total_rot), counterclockwise from the
+    #   x axis. (The y component is flipped back again to point down the image.)
+    strap_dir = all_res['strap_angle'] + all_res['total_rot']
+    left_seg_pixel_len = all_res['left_strap_seg_len'] / real_to_pixel_dist_ratio
+    S = (B_left[0] + left_seg_pixel_len * np.cos(strap_dir), B_left[1] - left_seg_pixel_len * np.sin(strap_dir))
+    if not shoulder_radius:
+        return [tuple(B_left), S, tuple(B_right)]
+    # The centre of the shoulder is a radius away from S, at right angles to the strap (clockwise, as seen with y up),
+    #   and the strap wraps clockwise around it through twice strap_angle.
+    radius = shoulder_radius / real_to_pixel_dist_ratio
+    centre = (S[0] + radius * np.sin(strap_dir), S[1] + radius * np.cos(strap_dir))
+    arc_angles = strap_dir + np.pi / 2 - np.linspace(0.0, 2 * all_res['strap_angle'], SHOULDER_ARC_SEGMENTS + 1)
+    arc = [(centre[0] + radius * np.cos(psi), centre[1] - radius * np.sin(psi)) for psi in arc_angles]
+    return [tuple(B_left)] + arc + [tuple(B_right)]
@@ -0,0 +1,180 @@
+# NL: A map of the equilibrium angle over the whole guitar image, for deciding where a marker could go. For every pixel
+#   position of one marker (B2 or the COM, with the other two markers held where they are), it shows the angle the
+#   guitar would hang at with that marker there, and leaves the positions that give unstable designs uncoloured.
+# That's a solve for every pixel in the window, so the map is split into square tiles, which are solved with
+#   gthoi_solver_batch on a pool of worker threads (NumPy releases the GIL for most of the work). Each tile is done at
+#   every level of detail in DEFAULT_STRIDES, coarsest first, so that a rough version of the whole map shows up quickly
+#   and is then refined. Finished tiles are cached by the positions of the fixed markers, the strap length and the
+#   length calibration, so going back to an earlier setup doesn't mean solving it all again.
+# With a shoulder of finite radius, each tile is carried over to the extended model, for the free-sliding angle (see
+#   gthoi_extended.py).
+# Nothing here depends on pygame: tiles come out as RGBA arrays, and get_the_hang_of_it.py draws them.
+
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from gthoi_extended import gthoi_solver_extended_batch
+from gthoi_geometry import solver_inputs
+from gthoi_solver import gthoi_solver_batch
+
+
+# The markers that can be mapped, i.e. moved over the image while the other two stay put.
+HEATMAP_MARKERS = ('B2', 'COM')
+
+# The side length of the tiles, in pixels.
+TILE_SIZE = 64
+
+# The levels of detail that each tile is solved at, in order, as the spacing in pixels between solves. (Each solve
+#   colours a block of stride x stride pixels.)
+DEFAULT_STRIDES = (16, 4, 1)
+
+# The colour map, as equilibrium angles (in degrees clockwise vs. the horizontal) and the RGB colours at those angles,
+#   which are interpolated in between: from blue for a neck pointing straight up, through green around the usual
+#   playing angle and yellow at horizontal, to red for a neck pointing straight down.
+COLOUR_MAP_ANGLES = (-90.0, -45.0, 0.0, 45.0, 90.0)
+COLOUR_MAP_COLOURS = ((0, 0, 255), (0, 200, 0), (255, 255, 0), (255, 128, 0), (255, 0, 0))
+
+# The opacity of the coloured (stable) parts of the map.
+HEATMAP_ALPHA = 140
+
+# The number of different setups (fixed markers, strap length and calibration) whose tiles are kept in the cache.
+MAX_CACHED_SETUPS = 8
+
+
+def angle_colours(total_rot):
+    """Maps equilibrium angles (total_rot, in radians) to RGBA colours, transparent wherever the angle is NaN."""
+    degrees = np.clip(np.nan_to_num(total_rot * 180 / np.pi), COLOUR_MAP_ANGLES[0], COLOUR_MAP_ANGLES[-1])
+    rgba = np.empty(np.shape(total_rot) + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(degrees, COLOUR_MAP_ANGLES, [colour[channel] for colour in COLOUR_MAP_COLOURS])
+    rgba[..., 3] = np.where(np.isnan(total_rot), 0, HEATMAP_ALPHA)
+    return rgba
+
+
+def heatmap_angles(moving, B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length, xs, ys,
+                   shoulder_radius=0.0):
+    """Returns the equilibrium angle (total_rot) with the moving marker ('B2' or 'COM') at each pixel position (x, y) on
+    the grid given by xs and ys, with the shape (len(ys), len(xs)). The centre given for the moving marker is ignored.
+    The angle is NaN wherever the design is unstable, or the strap doesn't reach between the buttons. shoulder_radius
+    chooses the extended model, as for gthoi_geometry.equilibrium."""
+    grid = np.stack(np.meshgrid(xs, ys), axis=-1)
+    if moving == 'B2':
+        g_1, g_2, theta_COM, pre_rot, _ = solver_inputs(B1_centre, COM_centre, grid)
+    elif moving == 'COM':
+        g_1, g_2, theta_COM, pre_rot, _ = solver_inputs(B1_centre, grid, B2_centre)
+    else:
+        raise ValueError(f"Unknown heatmap marker '{moving}'. Choose one of {HEATMAP_MARKERS}.")
+    g_1, g_2 = g_1 * real_to_pixel_dist_ratio, g_2 * real_to_pixel_dist_ratio
+    res = gthoi_solver_batch(g_1, g_2, theta_COM, strap_length)
+    if shoulder_radius:
+        res = gthoi_solver_extended_batch(g_1, g_2, theta_COM, strap_length, shoulder_radius, base=res)
+    return pre_rot + res['guitar_angle']
+
+
+def render_tile(setup, tile_rect, stride):
+    """Returns the RGBA colours (with the shape (height, width, 4)) of the tile at tile_rect = (x, y, width, height),
+    solved once for every stride x stride block of pixels. setup is as in HeatmapRenderer.request."""
+    x, y, width, height = tile_rect
+    # Each block is coloured by the solve at (about) its centre.
+    xs = np.arange(x, x + width, stride) + min(stride, width) // 2
+    ys = np.arange(y, y + height, stride) + min(stride, height) // 2
+    *marker_setup, shoulder_radius = setup
+    rgba = angle_colours(heatmap_angles(*marker_setup, xs, ys, shoulder_radius=shoulder_radius))
+    return np.repeat(np.repeat(rgba, stride, axis=0), stride, axis=1)[:height, :width]
+
+
+class HeatmapRenderer:
+    """Renders the map for a window of the given size (width, height) in the background, tile by tile."""
+
+    def __init__(self, size, tile_size=TILE_SIZE, strides=DEFAULT_STRIDES, workers=None):
+        self.tile_rects = [(x, y, min(tile_size, size[0] - x), min(tile_size, size[1] - y))
+                           for y in range(0, size[1], tile_size) for x in range(0, size[0], tile_size)]
+        self.strides = strides
+        self._executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        self._setup = None
+        self._pending = []
+        self._ready = []
+        self._drawn_strides = {}
+        self._cache = OrderedDict()
+        self._error_reported = False
+
+    def request(self, moving, B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length,
+                shoulder_radius=0.0):
+        """Starts rendering the map for this setup, unless it's the one already being rendered. Any tiles of it that are
+        in the cache are ready straight away, and anything still pending for a previous setup is cancelled.
+        Returns True if the setup has changed (in which case anything drawn from the previous one is out of date)."""
+        # The position of the moving marker doesn't matter, so leave it out of the setup:
+        centres = {'B1': tuple(B1_centre), 'COM': tuple(COM_centre), 'B2': tuple(B2_centre)}
+        centres[moving] = None
+        setup = (moving, centres['B1'], centres['COM'], centres['B2'], real_to_pixel_dist_ratio, strap_length,
+                 shoulder_radius)
+        if setup == self._setup:
+            return False
+
+        self.cancel()
+        self._setup = setup
+        self._error_reported = False
+        tiles = self._cache.setdefault(setup, {})
+        self._cache.move_to_end(setup)
+        while len(self._cache) > MAX_CACHED_SETUPS:
+            self._cache.popitem(last=False)
+
+        # Queue up every tile at every level of detail, coarsest first, skipping anything that's already been done.
+        for stride in self.strides:
+            for tile_rect in self.tile_rects:
+                if (tile_rect, stride) in tiles:
+                    self._ready.append((tile_rect, stride, tiles[(tile_rect, stride)]))
+                else:
+                    self._pending.append((tile_rect, stride, self._executor.submit(render_tile, setup, tile_rect,
+                                                                                    stride)))
+        return True
+
+    def poll(self):
+        """Returns the tiles that have been finished since the last call, as (tile_rect, stride, rgba). A tile is only
+        returned if it's finer than what's already been returned for the same tile_rect (as the tiles don't necessarily
+        finish in order), so they can all just be drawn.
+        A tile whose solve raises an exception is left out (and isn't cached, so it's tried again if this setup is
+        requested again later). The first such exception for each setup is printed."""
+        tiles = self._cache.get(self._setup)
+        still_pending = []
+        for tile_rect, stride, future in self._pending:
+            if future.done():
+                try:
+                    rgba = future.result()
+                except Exception as e:
+                    if not self._error_reported:
+                        print(f"Couldn't solve part of the map ({type(e).__name__}: {e}), so it's left out.")
+                        self._error_reported = True
+                    continue
+                tiles[(tile_rect, stride)] = rgba
+                self._ready.append((tile_rect, stride, rgba))
+            else:
+                still_pending.append((tile_rect, stride, future))
+        self._pending = still_pending
+
+        finished = []
+        for tile_rect, stride, rgba in sorted(self._ready, key=lambda tile: -tile[1]):
+            if stride < self._drawn_strides.get(tile_rect, np.inf):
+                self._drawn_strides[tile_rect] = stride
+                finished.append((tile_rect, stride, rgba))
+        self._ready = []
+        return finished
+
+    def is_done(self):
+        return not self._pending and not self._ready
+
+    def cancel(self):
+        """Cancels everything pending for the current setup, and forgets it."""
+        for _, _, future in self._pending:
+            future.cancel()
+        self._pending = []
+        self._ready = []
+        self._drawn_strides = {}
+        self._setup = None
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
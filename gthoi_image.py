@@ -0,0 +1,98 @@
+# NL: Loading the guitar image for get_the_hang_of_it.py, at whatever size the window needs it.
+# Decoding a large, high-resolution photo and scaling it down is most of the time it takes to start the GUI, so the
+#   image at the size it's first shown at (given by max_dim in the config file) is cached on disk, as an uncompressed
+#   bitmap, which loads in a fraction of the time. The cache is keyed by a hash of the image file and max_dim, so
+#   editing or replacing the image, or changing max_dim, just makes a new entry.
+# For resizing the window, the full-resolution image is only decoded if it's needed (i.e. the window gets bigger than
+#   anything already loaded), and is then kept as a pyramid of successively halved copies, so that each new size is
+#   scaled from the smallest copy that's at least as big.
+
+import hashlib
+import os
+
+import pygame as pg
+
+
+DEFAULT_CACHE_DIR = 'config/cache'
+
+# The pyramid of halved copies of the full-resolution image stops once the longest side would be below this many pixels.
+MIN_PYRAMID_DIM = 256
+
+
+def fit_size(image_size, max_dim):
+    """The size of an image of image_size = (width, height), scaled so that its longest side is max_dim pixels."""
+    image_scale_ratio = max_dim / max(image_size)
+    return int(image_size[0] * image_scale_ratio), int(image_size[1] * image_scale_ratio)
+
+
+class GuitarImage:
+    """The image at path, scaled to whatever size it's asked for. The surfaces returned haven't been converted to the
+    display's pixel format, as they may be needed before the display has been set up."""
+
+    def __init__(self, path, cache_dir=DEFAULT_CACHE_DIR):
+        self.path = path
+        self.cache_dir = cache_dir
+        with open(path, mode="rb") as image_file:
+            self.hash = hashlib.sha256(image_file.read()).hexdigest()[:16]
+        # Every copy of the image that's been loaded or made so far, largest first, and the full-resolution image, once
+        #   that's been decoded:
+        self._levels = []
+        self._full = None
+
+    def _cache_path(self, max_dim):
+        return os.path.join(self.cache_dir, f"{self.hash}_{max_dim}.bmp")
+
+    def _add_level(self, surface):
+        self._levels.append(surface)
+        self._levels.sort(key=lambda level: -level.get_width())
+
+    def _load_full(self):
+        full = self._full = pg.image.load(self.path)
+        self._add_level(full)
+        # (smoothscale averages over the pixels it's halving, but only works on 24 or 32 bit images.)
+        halve = pg.transform.smoothscale if full.get_bitsize() >= 24 else pg.transform.scale
+        level = full
+        while max(level.get_size()) // 2 >= MIN_PYRAMID_DIM:
+            level = halve(level, (level.get_width() // 2, level.get_height() // 2))
+            self._add_level(level)
+
+    def scaled(self, max_dim):
+        """The image scaled so that its longest side is max_dim pixels, from the smallest copy already loaded that's at
+        least that big. The full-resolution image is only decoded if there isn't one."""
+        big_enough = [level for level in self._levels if max(level.get_size()) >= max_dim]
+        if not big_enough and self._full is None:
+            self._load_full()
+            return self.scaled(max_dim)
+        # (If max_dim is bigger than the full-resolution image itself, it's scaled up from that.)
+        source = big_enough[-1] if big_enough else self._levels[0]
+        if max(source.get_size()) == max_dim:
+            return source
+        return pg.transform.scale(source, fit_size(source.get_size(), max_dim))
+
+    def load(self, max_dim):
+        """The image scaled so that its longest side is max_dim pixels, from the cache on disk if it's there, and
+        otherwise from the full-resolution image, which is then added to the cache."""
+        cache_path = self._cache_path(max_dim)
+        if os.path.exists(cache_path):
+            try:
+                surface = pg.image.load(cache_path)
+            except pg.error:
+                surface = None
+            if surface is not None:
+                self._add_level(surface)
+                return surface
+
+        if self._full is None:
+            self._load_full()
+        surface = pg.transform.scale(self._full, fit_size(self._full.get_size(), max_dim))
+        self._add_level(surface)
+        # The cache is only there to save time, so if it can't be written (e.g. a read-only folder), never mind. It's
+        #   written to a temporary file first, so that nothing ever loads a half-written one.
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.tmp.bmp"
+            pg.image.save(surface, temp_path)
+            os.replace(temp_path, cache_path)
+        except (OSError, pg.error):
+            pass
+        return surface
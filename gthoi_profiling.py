@@ -0,0 +1,138 @@
+# NL: Optional instrumentation of the solver, for finding out where the time goes. It's off unless it's turned on, by
+#   setting the environment variable GTHOI_PROFILE before starting any of the scripts, e.g.
+#   GTHOI_PROFILE=1 python get_the_hang_of_it.py
+#   GTHOI_PROFILE=profile.json python get_the_hang_of_it.py --headless
+# or with the --profile option of get_the_hang_of_it.py. A summary with a histogram of the timings of each stage is
+#   printed on exit, or, if GTHOI_PROFILE (or --profile) is the path of a .json file, everything is written there
+#   instead.
+# The instrumented code checks ENABLED once per call, and does nothing else when it's off, so the hooks can be left in
+#   for good. Each call records the time spent in each of its stages, with a StageTimer, and counts events of interest
+#   (e.g. unstable designs) with count().
+
+import atexit
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+
+# A residual in the final constraint check of the solver is counted as near the tolerance if it's more than this
+#   fraction of the way to failing the check.
+NEAR_TOLERANCE_FRACTION = 0.1
+
+# The histograms of the timings have a bin for each power of two microseconds, from 1 us up to this many.
+HISTOGRAM_MAX_US = 2**20
+
+ENABLED = False
+
+_timings = defaultdict(list)
+_counts = defaultdict(int)
+_output = None
+
+
+class StageTimer:
+    """Times the consecutive stages of a single call. Each call to lap(stage) records the time since the timer was
+    started (or since the last lap) as the time spent in '<name>.<stage>'."""
+
+    def __init__(self, name):
+        self.name = name
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        _timings[f"{self.name}.{stage}"].append(now - self._last)
+        self._last = now
+
+
+def stage_timer(name):
+    """Returns a StageTimer for a call to name if profiling is enabled, and otherwise None. Call sites check for None,
+    which is all that profiling costs them when it's off."""
+    return StageTimer(name) if ENABLED else None
+
+
+def count(name, n=1):
+    _counts[name] += n
+
+
+def count_residuals(name, err, eps):
+    """Counts the residuals err (a number or an array) from the final constraint check of a solver that fail it, and
+    that pass it, but only just, as '<name>.residual_failures' and '<name>.near_tolerance'."""
+    err = np.asarray(err)
+    count(f"{name}.residual_failures", int(np.count_nonzero(err >= eps)))
+    count(f"{name}.near_tolerance", int(np.count_nonzero((err < eps) & (err > NEAR_TOLERANCE_FRACTION * eps))))
+
+
+def enable(output=None):
+    """Turns profiling on, and arranges for everything recorded to be reported on exit: to output, if it's the path of a
+    .json file, and as a summary printed to stderr otherwise."""
+    global ENABLED, _output
+    if not ENABLED:
+        atexit.register(_report_on_exit)
+    ENABLED = True
+    _output = output
+
+
+def reset():
+    _timings.clear()
+    _counts.clear()
+
+
+def _histogram(seconds):
+    edges_us = 2.0**np.arange(np.log2(HISTOGRAM_MAX_US) + 1)
+    # Anything outside the bins is put in the end ones.
+    counts, _ = np.histogram(np.clip(np.asarray(seconds) * 1e6, edges_us[0], edges_us[-1]), bins=edges_us)
+    return edges_us, counts
+
+
+def report():
+    """Returns everything recorded so far, as a dict that can be written out as JSON. Timings are in seconds."""
+    stages = {}
+    for stage, seconds in sorted(_timings.items()):
+        edges_us, counts = _histogram(seconds)
+        stages[stage] = {'n': len(seconds),
+                         'total': float(np.sum(seconds)),
+                         'mean': float(np.mean(seconds)),
+                         'median': float(np.median(seconds)),
+                         'p95': float(np.percentile(seconds, 95)),
+                         'max': float(np.max(seconds)),
+                         'histogram_edges_us': edges_us.tolist(),
+                         'histogram_counts': counts.tolist()}
+    return {'stages': stages, 'counts': dict(sorted(_counts.items()))}
+
+
+def summary():
+    """Returns everything recorded so far as readable text, with a histogram of the timings of each stage."""
+    rep = report()
+    lines = ["Solver profile (times in us):"]
+    for stage, stats in rep['stages'].items():
+        lines.append(f"  {stage}: n={stats['n']}, total={stats['total'] * 1e6:.0f}, mean={stats['mean'] * 1e6:.1f}, "
+                     f"median={stats['median'] * 1e6:.1f}, p95={stats['p95'] * 1e6:.1f}, "
+                     f"max={stats['max'] * 1e6:.1f}")
+        counts = stats['histogram_counts']
+        largest = max(counts)
+        # Only the bins from the first to the last with anything in them:
+        used = [i for i, n in enumerate(counts) if n]
+        for i in range(used[0], used[-1] + 1):
+            lo, hi = stats['histogram_edges_us'][i], stats['histogram_edges_us'][i + 1]
+            bar = '#' * int(np.ceil(40 * counts[i] / largest))
+            lines.append(f"    {lo:>8.0f} - {hi:<8.0f} {bar:<40} {counts[i]}")
+    if rep['counts']:
+        lines.append("Counts:")
+        for name, n in rep['counts'].items():
+            lines.append(f"  {name}: {n}")
+    return "\n".join(lines)
+
+
+def _report_on_exit():
+    if _output is not None and _output.lower().endswith('.json'):
+        with open(_output, mode="w") as output_file:
+            json.dump(report(), output_file, indent=4)
+    else:
+        print(summary(), file=sys.stderr)
+
+
+if os.environ.get('GTHOI_PROFILE'):
+    enable(os.environ['GTHOI_PROFILE'])
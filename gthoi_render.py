@@ -0,0 +1,103 @@
+# NL: Drawing for the GUI in get_the_hang_of_it.py. Rather than redrawing the whole window every time something changes,
+#   DirtyRectRenderer keeps track of the rectangles that have changed since the last frame (e.g. where a marker was and
+#   where it is now), restores just those from the background, redraws whatever overlaps them, and pushes just those
+#   to the display. With a large max_dim, that's a small fraction of the work of redrawing the whole image every frame.
+# FrameTimer keeps track of how long the frames are taking, for checking that dragging a marker stays smooth.
+
+import time
+from collections import deque
+
+import pygame as pg
+
+
+# Past this many dirty rectangles in a frame (e.g. when a lot of map tiles come in at once), they're all merged into
+#   one, as it's cheaper to redraw a bit more than to redraw the scene once for each of lots of small rectangles.
+MAX_DIRTY_RECTS = 32
+
+# The number of frames that FrameTimer averages over.
+FRAME_TIMER_WINDOW = 120
+
+
+def _merge_rects(rects):
+    """Merges any overlapping rectangles, so that nothing is drawn twice."""
+    merged = []
+    for rect in rects:
+        # Merging two rectangles can make the result overlap one that was checked already, so keep going until it
+        #   doesn't overlap anything.
+        while True:
+            i = rect.collidelist(merged)
+            if i == -1:
+                break
+            rect = rect.union(merged.pop(i))
+        merged.append(rect)
+    return merged
+
+
+class DirtyRectRenderer:
+    """Draws the scene onto screen over background (a surface of the same size), one dirty rectangle at a time."""
+
+    def __init__(self, screen, background):
+        self.screen = screen
+        self.background = background
+        self._dirty = []
+
+    def mark_dirty(self, *rects):
+        """Flags rects (anything that pygame takes as a rect, or None, which is ignored) to be redrawn next frame."""
+        screen_rect = self.screen.get_rect()
+        for rect in rects:
+            if rect is not None:
+                rect = pg.Rect(rect).clip(screen_rect)
+                if rect.width and rect.height:
+                    self._dirty.append(rect)
+
+    def mark_all(self):
+        """Flags the whole screen to be redrawn next frame."""
+        self._dirty = [self.screen.get_rect()]
+
+    def render(self, draw_scene):
+        """Redraws the dirty rectangles and pushes them to the display. draw_scene(surf) should draw everything that
+        goes over the background onto surf. It's called once for each rectangle, with drawing clipped to it.
+        Returns the rectangles that were redrawn (none if nothing has changed)."""
+        if not self._dirty:
+            return []
+        rects = _merge_rects(self._dirty)
+        if len(rects) > MAX_DIRTY_RECTS:
+            rects = [rects[0].unionall(rects[1:])]
+        for rect in rects:
+            self.screen.set_clip(rect)
+            self.screen.blit(self.background, rect, rect)
+            draw_scene(self.screen)
+        self.screen.set_clip(None)
+        pg.display.update(rects)
+        self._dirty = []
+        return rects
+
+
+class FrameTimer:
+    """Keeps track of the time between frames, and the time spent drawing them, over the last few frames."""
+
+    def __init__(self, window=FRAME_TIMER_WINDOW):
+        self._frame_starts = deque(maxlen=window + 1)
+        self._render_times = deque(maxlen=window)
+
+    def start_frame(self):
+        self._frame_starts.append(time.perf_counter())
+
+    def record_render(self, seconds):
+        self._render_times.append(seconds)
+
+    def summary(self):
+        """Returns the frame rate, the longest time between frames (in ms) and the mean time spent drawing a frame (in
+        ms), or None until there have been a couple of frames."""
+        if len(self._frame_starts) < 2:
+            return None
+        frame_times = [t_1 - t_0 for t_0, t_1 in zip(self._frame_starts, list(self._frame_starts)[1:])]
+        fps = len(frame_times) / sum(frame_times)
+        render_ms = 1e3 * sum(self._render_times) / len(self._render_times) if self._render_times else 0.0
+        return fps, 1e3 * max(frame_times), render_ms
+
+    def __str__(self):
+        summary = self.summary()
+        if summary is None:
+            return "no frames yet"
+        return f"{summary[0]:.1f} fps, longest frame {summary[1]:.1f} ms, drawing {summary[2]:.2f} ms per frame"
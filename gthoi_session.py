@@ -0,0 +1,147 @@
+# NL: Recording a session of get_the_hang_of_it.py, and replaying it, for tuning the GUI against real use, e.g.
+#   python get_the_hang_of_it.py --record session.json
+#   python get_the_hang_of_it.py --replay session.json
+# A recording is the config the session started from, every event that the GUI acts on (mouse drags, key presses and
+#   text input, and resizing and closing the window), by the frame it came in, the message printed for every solve
+#   with the 'h' key, and the frames that the results of the 'a' and 'u' keys came in.
+# A replay feeds the same events in, frame by frame, with SDL's dummy video driver (so no window), and as fast as it
+#   can, rather than at the frame rate. It times each frame, the drawing in each frame, and each solve, and checks that
+#   the solves print the same as they did in the recording. So that the replay doesn't depend on how long the solves
+#   take, a result is only picked up in a frame that one came in in the recording (waiting for it there, if need be),
+#   and never in between. A solve that was overtaken in the recording by a change to the system is then overtaken in
+#   the replay too, and never prints in either. The results of 'a' and 'u' are picked up in the same frames as in the
+#   recording in the same way (so e.g. the strap length that 'a' sets changes in the same frame).
+
+import json
+
+import numpy as np
+import pygame as pg
+
+
+# The events that are recorded: everything the main loop acts on.
+RECORDED_EVENT_TYPES = (pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP, pg.MOUSEMOTION, pg.KEYDOWN, pg.TEXTINPUT,
+                        pg.VIDEORESIZE, pg.QUIT)
+
+# Events are recorded by name rather than number, which could change between versions of pygame.
+_EVENT_TYPES_BY_NAME = {pg.event.event_name(event_type): event_type for event_type in RECORDED_EVENT_TYPES}
+
+
+def _event_to_json(event):
+    # Only the plain values are kept (which leaves out e.g. the window that the event came from).
+    attributes = {key: list(value) if isinstance(value, tuple) else value for key, value in event.dict.items()
+                  if isinstance(value, (bool, int, float, str, tuple))}
+    return {'type': pg.event.event_name(event.type), 'attributes': attributes}
+
+
+def _event_from_json(event_json):
+    attributes = {key: tuple(value) if isinstance(value, list) else value
+                  for key, value in event_json['attributes'].items()}
+    return pg.event.Event(_EVENT_TYPES_BY_NAME[event_json['type']], attributes)
+
+
+class SessionRecorder:
+    """Records a session that starts from configs (a loaded config file), and writes it to path when it's saved."""
+
+    def __init__(self, path, configs):
+        self.path = path
+        self.configs = dict(configs)
+        self.frames = []
+        self.solves = []
+        self.tasks = []
+        self.n_frames = 0
+
+    def record_frame(self, frame, events):
+        events = [_event_to_json(event) for event in events if event.type in RECORDED_EVENT_TYPES]
+        if events:
+            self.frames.append({'frame': frame, 'events': events})
+        self.n_frames = frame + 1
+
+    def record_solve(self, frame, message):
+        self.solves.append({'frame': frame, 'message': message})
+
+    def record_task(self, frame):
+        self.tasks.append({'frame': frame})
+
+    def save(self):
+        with open(self.path, mode="w") as session_file:
+            json.dump({'config': self.configs, 'n_frames': self.n_frames, 'frames': self.frames,
+                       'solves': self.solves, 'tasks': self.tasks}, session_file)
+
+
+class SessionReplay:
+    """A recorded session, loaded from path, to be replayed. Keeps track of the timings and the solve messages."""
+
+    def __init__(self, path):
+        with open(path, mode="r") as session_file:
+            session = json.load(session_file)
+        self.path = path
+        self.configs = session['config']
+        self.n_frames = session['n_frames']
+        self._frames = {frame['frame']: [_event_from_json(event) for event in frame['events']]
+                        for frame in session['frames']}
+        self.recorded_messages = [solve['message'] for solve in session['solves']]
+        self._solve_frames = {solve['frame'] for solve in session['solves']}
+        # (A session recorded before 'a' and 'u' were run in the background has no 'tasks', as they were over within
+        #   the frame they were asked for in.)
+        self._task_frames = {task['frame'] for task in session['tasks']} if 'tasks' in session else None
+        self.messages = []
+        self.frame_times = []
+        self.render_times = []
+        self.solve_times = []
+
+    def events(self, frame):
+        """The events recorded in frame."""
+        return self._frames.get(frame, [])
+
+    def solve_came_in(self, frame):
+        """Whether the result of a solve came in in frame, in the recording."""
+        return frame in self._solve_frames
+
+    def task_came_in(self, frame):
+        """Whether the result of an 'a' or 'u' key came in in frame, in the recording (see TaskWorker)."""
+        return self._task_frames is None or frame in self._task_frames
+
+    def is_done(self, frame):
+        return frame >= self.n_frames
+
+    def mismatches(self):
+        """Describes each difference between the solve messages in the recording and the replay."""
+        mismatches = []
+        for i in range(max(len(self.recorded_messages), len(self.messages))):
+            recorded = self.recorded_messages[i] if i < len(self.recorded_messages) else "(nothing)"
+            replayed = self.messages[i] if i < len(self.messages) else "(nothing)"
+            if recorded != replayed:
+                mismatches.append(f"Solve {i + 1}: recorded \"{recorded}\", replayed \"{replayed}\"")
+        return mismatches
+
+    def report(self, wall_time):
+        """Returns the timings of the replay, and the result of the check on the solves, as a dict that can be written
+        out as JSON. Times are in seconds."""
+        def stats(seconds):
+            if not seconds:
+                return None
+            return {'n': len(seconds), 'total': float(np.sum(seconds)), 'mean': float(np.mean(seconds)),
+                    'median': float(np.median(seconds)), 'p95': float(np.percentile(seconds, 95)),
+                    'max': float(np.max(seconds))}
+        return {'session': self.path, 'wall_time': wall_time, 'n_frames': len(self.frame_times),
+                'frame_times': stats(self.frame_times), 'render_times': stats(self.render_times),
+                'solve_times': stats(self.solve_times), 'n_solves': len(self.messages),
+                'mismatches': self.mismatches()}
+
+
+def replay_summary(report):
+    """Returns the report of a replay as readable text."""
+    lines = [f"Replayed {report['n_frames']} frames of {report['session']} in {report['wall_time']:.3f} s."]
+    for key, title in (('frame_times', "Frame"), ('render_times', "Drawing (frames that drew anything)"),
+                       ('solve_times', "Solve ('h' key)")):
+        stats = report[key]
+        if stats:
+            lines.append(f"  {title}: n={stats['n']}, mean {stats['mean'] * 1e3:.2f} ms, median "
+                         f"{stats['median'] * 1e3:.2f} ms, p95 {stats['p95'] * 1e3:.2f} ms, max "
+                         f"{stats['max'] * 1e3:.2f} ms")
+    if report['mismatches']:
+        lines.append("  The solves don't match the recording:")
+        lines.extend(f"    {mismatch}" for mismatch in report['mismatches'])
+    else:
+        lines.append(f"  All {report['n_solves']} solves match the recording.")
+    return "\n".join(lines)
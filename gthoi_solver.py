@@ -9,9 +9,46 @@
 #  "C.O.M. kink" is in the right direction (meaning that theta_COM <= pi).
 
 import numpy as np
-from sympy import solve
-from sympy.abc import l
-from sympy.core.numbers import Float
+
+import gthoi_profiling
+
+
+# The backends available for finding the roots of the quartic (see gthoi_solver below):
+# 'numpy': the default. Finds the roots numerically, as the eigenvalues of the quartic's companion matrix, directly from
+#   the coefficients C_4..C_0. This takes tens of microseconds.
+# 'sympy': the original symbolic solve. It's orders of magnitude slower (and SymPy itself takes seconds to import), so
+#   it's only imported when it's asked for, and is kept mainly as a reference for checking the numpy backend against.
+SOLVER_BACKENDS = ('numpy', 'sympy')
+
+# A root found by the numpy backend is accepted as real if its imaginary part is within this fraction of its modulus.
+#   This needs to be loose enough to accept a pair of (nearly) coincident real roots, which the eigenvalue solver will
+#   typically return as a complex pair with imaginary parts around sqrt(machine epsilon) relative to the root, and tight
+#   enough to reject any complex pair that's actually meaningful.
+REAL_ROOT_RTOL = 1e-7
+
+# The residual of the correct solution in the final constraint check (see gthoi_solver below) must be within this
+#   fraction of the strap length.
+RESIDUAL_RTOL = 1e-8
+
+# Per-row status codes returned by gthoi_solver_batch:
+# STATUS_OK: a single, stable, valid equilibrium was found.
+# STATUS_UNSTABLE: the case in which gthoi_solver returns an empty result, i.e. the design is unstable.
+# STATUS_RESIDUAL: the best candidate solution failed the final residual check (the case in which gthoi_solver asserts).
+# STATUS_INVALID: the inputs don't describe a system at all: something isn't finite or positive, or the strap is too
+#   short to reach between the buttons.
+STATUS_OK = 0
+STATUS_UNSTABLE = 1
+STATUS_RESIDUAL = 2
+STATUS_INVALID = 3
+
+# The structured array returned by gthoi_solver_batch. The three values have the same meanings as the keys of the
+#   result_dict returned by gthoi_solver, and are NaN wherever status isn't STATUS_OK. 'stable' is just
+#   status == STATUS_OK.
+BATCH_RESULT_DTYPE = np.dtype([('guitar_angle', np.float64),
+                               ('left_strap_seg_len', np.float64),
+                               ('strap_angle', np.float64),
+                               ('stable', np.bool_),
+                               ('status', np.int8)])
 
 
 # There are four parameters specifying the system:
@@ -19,29 +56,35 @@ from sympy.core.numbers import Float
 # g_2: The length of the segment between the C.O.M. and the right/top strap button (facing the player).
 # theta_COM: The angle between the above two segments.
 # L: The total length of the strap.
-def gthoi_solver(g_1, g_2, theta_COM, L):
+# The optional backend argument picks the method used for finding the roots of the quartic: see SOLVER_BACKENDS above.
+# The stages of each call are timed if profiling is enabled (see gthoi_profiling.py).
+def gthoi_solver(g_1, g_2, theta_COM, L, backend='numpy'):
+    timer = gthoi_profiling.stage_timer('gthoi_solver')
 
     # The coefficients of the quartic in the length l of the leftmost (facing the player) segment of the strap:
     #   C_4*l**4 + C_3*l**3 + C_2*l**2 + C_1*l + C_0 = 0:
-    A = (g_1/g_2) / np.sin(theta_COM)
-    B = 1 / np.tan(theta_COM)
-    g_3 = np.sqrt(g_1**2 + g_2**2 - 2*g_1*g_2*np.cos(theta_COM))
-    C_4 = -4*(1 + A**2 - 2*A*B + B**2)
-    C_3 = 4*L*(1 + A**2 - 2*A*B + B**2) - 4*(2*A*B*L - 2*L*A**2)
-    C_2 = (g_3**2 - L**2)*(1 + A**2 - 2*A*B + B**2) + 4*L*(2*A*B*L - 2*L*A**2) - 4*(A**2*L**2 - g_1**2)
-    C_1 = 4*A**2*L**3 + (g_3**2 - L**2)*(2*A*B*L - 2*L*A**2) - 4*g_1**2*L
-    C_0 = (g_3**2 - L**2)*A**2*L**2
+    A, B, coeffs = quartic_coefficients(g_1, g_2, theta_COM, L)
+    if timer:
+        timer.lap('coefficients')
+        gthoi_profiling.count('gthoi_solver.solves')
 
-    # Now call the quartic solver to get the solution(s) for l:
-    sols = solve(C_4*l**4 + C_3*l**3 + C_2*l**2 + C_1*l + C_0)
-    # Keep only the real solutions:
-    real_l = np.array([float(r) for r in sols if isinstance(r, Float)])
+    # Now call the quartic solver to get the real solution(s) for l:
+    if backend == 'numpy':
+        real_l = _numpy_real_roots(coeffs)
+    elif backend == 'sympy':
+        real_l = _sympy_real_roots(coeffs)
+    else:
+        raise ValueError(f"Unknown solver backend '{backend}'. Choose one of {SOLVER_BACKENDS}.")
+    if timer:
+        timer.lap('roots')
 
-    # There is the chance that you've been given an unstable/ill-specified system, and that there are no real solutions.
+    # There is the chance that you've been given an unstable/ill-specified system, and that there aren't exactly the
+    #   two real solutions described below.
     # This typically comes up when someone puts the C.O.M. very close to the segment between the strap buttons. You
-    #   know, like a Gibson SG. What happens here is that you get a few different solutions with tiny imaginary
-    #   components, where the real components of each represent the respective cases of (a) balancing near the
-    #   horizontal, (b) the head diving straight at the floor, and (c) the head flying up and smacking you in the teeth.
+    #   know, like a Gibson SG. What happens here is that you get four real solutions, where three of them represent
+    #   the respective cases of (a) balancing near the horizontal, (b) the head diving straight at the floor, and (c)
+    #   the head flying up and smacking you in the teeth. (SymPy's closed-form quartic solution returns these with tiny
+    #   imaginary components, which are just round-off from its complex intermediate terms.)
     # Their residuals are all actually very small, as they all represent approximate solutions to the original problem
     #   as posed, but this is not a situation you want to be in, as the middle solution is not stable, and the guitar
     #   ultimately wants to end up in whichever of the near-vertical situations puts the C.O.M. further down. In the
@@ -49,7 +92,9 @@ def gthoi_solver(g_1, g_2, theta_COM, L):
     #   catastrophic neck dive. You know, like a Gibson SG.
     # None of these solutions will be returned, and the empty return serves as a warning that you should pick a
     #   different design.
-    if real_l.size == 0:
+    if real_l.size != 2:
+        if timer:
+            gthoi_profiling.count('gthoi_solver.unstable')
         return {}
     # Otherwise, you're in the intended case of a single, stable, valid equilibrium, and you can proceed as below.
     # (This appears as two real solutions, one of which represents the strap pushing instead of pulling, which can be
@@ -58,6 +103,8 @@ def gthoi_solver(g_1, g_2, theta_COM, L):
     # Solve for the unknown angles through substitution (see derivation);
     theta_g = np.arctan(A*(L/real_l - 1) + B)
     theta_s = np.arccos(g_1 * np.cos(theta_g) / real_l)
+    if timer:
+        timer.lap('back_substitution')
 
     # We should now have two candidate solutions for (l, theta_g, theta_s). Because inverse trig operations are
     #   involved, we actually have many shadow candidate solutions as well: arctan + pi is always another solution to
@@ -82,7 +129,10 @@ def gthoi_solver(g_1, g_2, theta_COM, L):
     correct_ind = np.argmin(err)
 
     # Some bit of numerical error is tolerated in the correct solution. Define that tolerance for a final check here:
-    eps = 1e-8 * L
+    eps = RESIDUAL_RTOL * L
+    if timer:
+        timer.lap('selection')
+        gthoi_profiling.count_residuals('gthoi_solver', err[correct_ind], eps)
     assert(err[correct_ind] < eps)
 
     # The final results:
@@ -103,5 +153,353 @@ def gthoi_solver(g_1, g_2, theta_COM, L):
     return result_dict
 
 
+def gthoi_solver_batch(g_1, g_2, theta_COM, L):
+    """The vectorised equivalent of gthoi_solver (with the numpy backend), for arrays of geometries.
+
+    The arguments are broadcast together, and the result is a structured array of that shape with BATCH_RESULT_DTYPE.
+    Rows that gthoi_solver would return {} for, or fail its assert on, are flagged by their status instead, so that one
+    bad geometry doesn't stop the rest of a sweep."""
+    timer = gthoi_profiling.stage_timer('gthoi_solver_batch')
+    g_1, g_2, theta_COM, L = (np.asarray(x, dtype=float) for x in np.broadcast_arrays(g_1, g_2, theta_COM, L))
+    shape = g_1.shape
+    g_1, g_2, theta_COM, L = g_1.ravel(), g_2.ravel(), theta_COM.ravel(), L.ravel()
+
+    result = np.empty(g_1.size, dtype=BATCH_RESULT_DTYPE)
+    result['guitar_angle'] = np.nan
+    result['left_strap_seg_len'] = np.nan
+    result['strap_angle'] = np.nan
+    result['status'] = STATUS_INVALID
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        A, B, coeffs = quartic_coefficients(g_1, g_2, theta_COM, L)
+        g_3 = np.sqrt(g_1**2 + g_2**2 - 2*g_1*g_2*np.cos(theta_COM))
+    valid = ((g_1 > 0) & (g_2 > 0) & (theta_COM > 0) & (theta_COM <= np.pi) & (L > g_3) &
+             np.all(np.isfinite(coeffs), axis=-1))
+    rows = np.flatnonzero(valid)
+    A, B, coeffs = A[rows], B[rows], coeffs[rows]
+    g_1, g_2, theta_COM, L = (x[rows, np.newaxis] for x in (g_1, g_2, theta_COM, L))
+    A, B = A[:, np.newaxis], B[:, np.newaxis]
+    if timer:
+        timer.lap('coefficients')
+
+    # Find all of the roots in one go, then keep the rows with exactly two real ones, as in gthoi_solver. Sorting the
+    #   roots with the complex ones replaced by NaN brings the two real ones to the front of each row.
+    roots = quartic_roots(coeffs)
+    is_real = np.abs(roots.imag) <= REAL_ROOT_RTOL * np.abs(roots)
+    two_real = np.count_nonzero(is_real, axis=-1) == 2
+    result['status'][rows] = np.where(two_real, STATUS_RESIDUAL, STATUS_UNSTABLE)
+    real_l = polish_roots(coeffs, np.sort(np.where(is_real, roots.real, np.nan), axis=-1)[:, :2])
+    if timer:
+        timer.lap('roots')
+
+    # The same back-substitution and impostor check as in gthoi_solver (see the comments there), along the last axis.
+    #   Any candidates that make no sense at all (e.g. an arccos out of range) end up with a NaN residual, so they can
+    #   never be picked.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        theta_g = np.arctan(A*(L/real_l - 1) + B)
+        theta_s = np.arccos(g_1 * np.cos(theta_g) / real_l)
+        if timer:
+            timer.lap('back_substitution')
+        err = np.abs(np.sin(theta_g)*g_1 + np.sin(theta_s)*real_l -
+                     ((L-real_l)*np.sin(theta_s) + g_2*np.sin(np.pi-theta_COM-theta_g)))
+    err = np.where(np.isnan(err), np.inf, err)
+    correct_ind = np.argmin(err, axis=-1)[:, np.newaxis]
+    best_err = np.take_along_axis(err, correct_ind, axis=-1)[:, 0]
+    ok = two_real & (best_err < RESIDUAL_RTOL * L[:, 0])
+
+    ok_rows = rows[ok]
+    result['status'][ok_rows] = STATUS_OK
+    result['guitar_angle'][ok_rows] = np.take_along_axis(theta_g, correct_ind, axis=-1)[ok, 0]
+    result['left_strap_seg_len'][ok_rows] = np.take_along_axis(real_l, correct_ind, axis=-1)[ok, 0]
+    result['strap_angle'][ok_rows] = np.take_along_axis(theta_s, correct_ind, axis=-1)[ok, 0]
+    result['stable'] = result['status'] == STATUS_OK
+    if timer:
+        timer.lap('selection')
+        gthoi_profiling.count('gthoi_solver_batch.solves', result.size)
+        gthoi_profiling.count('gthoi_solver_batch.unstable', int(np.count_nonzero(result['status'] == STATUS_UNSTABLE)))
+        gthoi_profiling.count('gthoi_solver_batch.invalid', int(np.count_nonzero(result['status'] == STATUS_INVALID)))
+        gthoi_profiling.count_residuals('gthoi_solver_batch', best_err[two_real], RESIDUAL_RTOL * L[two_real, 0])
+
+    return result.reshape(shape)
+
+
+def gthoi_solver_warm(g_1, g_2, theta_COM, L, l_guess, n_iter=6):
+    """Like gthoi_solver, but starts from a guess for the left strap segment length l and refines it by Newton's method.
+
+    This is meant for when the geometry is changing continuously (e.g. while dragging a marker), so that the previous
+    solution is a very good guess for the next one. Whenever the refined root can't be confirmed cheaply as the correct,
+    stable solution, this just falls back to gthoi_solver."""
+    timer = gthoi_profiling.stage_timer('gthoi_solver_warm')
+    if timer:
+        gthoi_profiling.count('gthoi_solver_warm.solves')
+    A, B, coeffs = quartic_coefficients(g_1, g_2, theta_COM, L)
+    C_4, C_3, C_2, C_1, C_0 = (float(c) for c in coeffs)
+
+    l_root = float(l_guess)
+    for _ in range(n_iter):
+        p = (((C_4*l_root + C_3)*l_root + C_2)*l_root + C_1)*l_root + C_0
+        dp = ((4*C_4*l_root + 3*C_3)*l_root + 2*C_2)*l_root + C_1
+        if dp == 0:
+            return gthoi_solver(g_1, g_2, theta_COM, L)
+        l_root -= p / dp
+
+    # The system is stable only if there are exactly two real roots (see gthoi_solver), so after dividing out the one
+    #   we've found, the remaining cubic must have a single real root, i.e. a negative discriminant. It's computed for
+    #   the monic cubic in l/L, so that the margin below is independent of scale. Anywhere near zero is the border
+    #   between stable and unstable, which is left to gthoi_solver to decide.
+    b_2 = (C_3 + C_4*l_root) / C_4 / L
+    b_1 = (C_2 + (C_3 + C_4*l_root)*l_root) / C_4 / L**2
+    b_0 = (C_1 + (C_2 + (C_3 + C_4*l_root)*l_root)*l_root) / C_4 / L**3
+    disc = 18*b_2*b_1*b_0 - 4*b_2**3*b_0 + b_2**2*b_1**2 - 4*b_1**3 - 27*b_0**2
+    if not disc < -1e-10:
+        return gthoi_solver(g_1, g_2, theta_COM, L)
+
+    # The same back-substitution and final constraint check as in gthoi_solver. A root that passes it can only be the
+    #   correct solution, not the impostor.
+    theta_g = np.arctan(A*(L/l_root - 1) + B)
+    cos_theta_s = g_1 * np.cos(theta_g) / l_root
+    if not abs(cos_theta_s) <= 1:
+        return gthoi_solver(g_1, g_2, theta_COM, L)
+    theta_s = np.arccos(cos_theta_s)
+    err = np.abs(np.sin(theta_g)*g_1 + np.sin(theta_s)*l_root -
+                 ((L-l_root)*np.sin(theta_s) + g_2*np.sin(np.pi-theta_COM-theta_g)))
+    if not err < RESIDUAL_RTOL * L:
+        return gthoi_solver(g_1, g_2, theta_COM, L)
+    # (Whatever falls back to gthoi_solver is timed there, so this only times the solves that don't.)
+    if timer:
+        timer.lap('warm_solve')
+        gthoi_profiling.count('gthoi_solver_warm.warm_solves')
+
+    return {'guitar_angle': theta_g,
+            'left_strap_seg_len': l_root,
+            'strap_angle': theta_s}
+
+
+def gthoi_solver_batch_warm(g_1, g_2, theta_COM, L, l_guess, n_iter=6):
+    """The vectorised equivalent of gthoi_solver_warm: gthoi_solver_batch, but starting from guesses l_guess for the
+    left strap segment length, which are refined by Newton's method.
+
+    This is meant for batches of geometries that are all close to one whose solution is known (e.g. random
+    perturbations of it), where it's many times faster than finding all of the roots of every quartic. The arguments
+    are broadcast together, and the result is the same as from gthoi_solver_batch. Any row in which the refined root
+    can't be confirmed cheaply as the correct, stable solution is handed to gthoi_solver_batch instead."""
+    timer = gthoi_profiling.stage_timer('gthoi_solver_batch_warm')
+    g_1, g_2, theta_COM, L, l_root = (np.asarray(x, dtype=float) for x in
+                                      np.broadcast_arrays(g_1, g_2, theta_COM, L, l_guess))
+    shape = g_1.shape
+    g_1, g_2, theta_COM, L, l_root = g_1.ravel(), g_2.ravel(), theta_COM.ravel(), L.ravel(), l_root.ravel()
+
+    result = np.empty(g_1.size, dtype=BATCH_RESULT_DTYPE)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        A, B, coeffs = quartic_coefficients(g_1, g_2, theta_COM, L)
+        C_4, C_3, C_2, C_1, C_0 = np.moveaxis(coeffs, -1, 0)
+        for _ in range(n_iter):
+            p = (((C_4*l_root + C_3)*l_root + C_2)*l_root + C_1)*l_root + C_0
+            dp = ((4*C_4*l_root + 3*C_3)*l_root + 2*C_2)*l_root + C_1
+            l_root = l_root - p / dp
+
+        # The same checks as in gthoi_solver_warm (see the comments there): the deflated cubic must have a single real
+        #   root, and the refined root must pass the final constraint check. Anything NaN fails them.
+        b_2 = (C_3 + C_4*l_root) / C_4 / L
+        b_1 = (C_2 + (C_3 + C_4*l_root)*l_root) / C_4 / L**2
+        b_0 = (C_1 + (C_2 + (C_3 + C_4*l_root)*l_root)*l_root) / C_4 / L**3
+        disc = 18*b_2*b_1*b_0 - 4*b_2**3*b_0 + b_2**2*b_1**2 - 4*b_1**3 - 27*b_0**2
+        theta_g = np.arctan(A*(L/l_root - 1) + B)
+        theta_s = np.arccos(g_1 * np.cos(theta_g) / l_root)
+        err = np.abs(np.sin(theta_g)*g_1 + np.sin(theta_s)*l_root -
+                     ((L-l_root)*np.sin(theta_s) + g_2*np.sin(np.pi-theta_COM-theta_g)))
+        g_3 = np.sqrt(g_1**2 + g_2**2 - 2*g_1*g_2*np.cos(theta_COM))
+    ok = ((disc < -1e-10) & (err < RESIDUAL_RTOL * L) &
+          (g_1 > 0) & (g_2 > 0) & (theta_COM > 0) & (theta_COM <= np.pi) & (L > g_3))
+    result['guitar_angle'] = np.where(ok, theta_g, np.nan)
+    result['left_strap_seg_len'] = np.where(ok, l_root, np.nan)
+    result['strap_angle'] = np.where(ok, theta_s, np.nan)
+    result['stable'] = ok
+    result['status'] = STATUS_OK
+    if timer:
+        timer.lap('warm_solve')
+        gthoi_profiling.count('gthoi_solver_batch_warm.solves', result.size)
+        gthoi_profiling.count('gthoi_solver_batch_warm.warm_solves', int(np.count_nonzero(ok)))
+
+    # (The rows that are handed over are timed by gthoi_solver_batch.)
+    cold = np.flatnonzero(~ok)
+    if cold.size:
+        result[cold] = gthoi_solver_batch(g_1[cold], g_2[cold], theta_COM[cold], L[cold])
+    return result.reshape(shape)
+
+
+def gthoi_solver_gradient(g_1, g_2, theta_COM, L, guitar_angle, left_strap_seg_len, strap_angle):
+    """Returns the partial derivatives of the solution with respect to g_1, g_2, theta_COM and L, at a solution from
+    one of the solvers above.
+
+    They're found analytically, by the implicit function theorem, from the constraints that define the solution: the
+    two horizontal ones and the vertical one (the equations in the Method of Solution section of readme.md, and the
+    final check). The result is an array of the shape (..., 3, 4): the derivatives of guitar_angle, left_strap_seg_len
+    and strap_angle (in that order) by g_1, g_2, theta_COM and L (in that order). All of the arguments can be NumPy
+    arrays, as long as they broadcast together. The derivatives are NaN where the solution is."""
+    g_1, g_2, theta_COM, L, theta_g, l, theta_s = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (g_1, g_2, theta_COM, L, guitar_angle, left_strap_seg_len, strap_angle)))
+    zeros = np.zeros_like(g_1)
+    phi = theta_COM + theta_g
+    # The constraints, as F = 0, with F = (F_1, F_2, F_3):
+    #   F_1 = g_1*cos(theta_g) - l*cos(theta_s)
+    #   F_2 = -g_2*cos(theta_COM + theta_g) - (L - l)*cos(theta_s)
+    #   F_3 = g_1*sin(theta_g) + l*sin(theta_s) - g_2*sin(theta_COM + theta_g) - (L - l)*sin(theta_s)
+    # Their derivatives by the unknowns (theta_g, l, theta_s):
+    dF_du = np.stack([
+        np.stack([-g_1*np.sin(theta_g), -np.cos(theta_s), l*np.sin(theta_s)], axis=-1),
+        np.stack([g_2*np.sin(phi), np.cos(theta_s), (L - l)*np.sin(theta_s)], axis=-1),
+        np.stack([g_1*np.cos(theta_g) - g_2*np.cos(phi), 2*np.sin(theta_s), (2*l - L)*np.cos(theta_s)], axis=-1),
+    ], axis=-2)
+    # And by the parameters (g_1, g_2, theta_COM, L):
+    dF_dp = np.stack([
+        np.stack([np.cos(theta_g), zeros, zeros, zeros], axis=-1),
+        np.stack([zeros, -np.cos(phi), g_2*np.sin(phi), -np.cos(theta_s)], axis=-1),
+        np.stack([np.sin(theta_g), -np.sin(phi), -g_2*np.cos(phi), -np.sin(theta_s)], axis=-1),
+    ], axis=-2)
+    finite = np.all(np.isfinite(dF_du), axis=(-2, -1)) & np.all(np.isfinite(dF_dp), axis=(-2, -1))
+    dF_du = np.where(finite[..., np.newaxis, np.newaxis], dF_du, np.eye(3))
+    du_dp = -np.linalg.solve(dF_du, dF_dp)
+    return np.where(finite[..., np.newaxis, np.newaxis], du_dp, np.nan)
+
+
+def quartic_coefficients(g_1, g_2, theta_COM, L):
+    """Returns A, B and the coefficients (C_4, C_3, C_2, C_1, C_0) of the quartic in l, stacked along the last axis.
+
+    All of the arguments can be NumPy arrays, as long as they broadcast together."""
+    A = (g_1/g_2) / np.sin(theta_COM)
+    B = 1 / np.tan(theta_COM)
+    g_3 = np.sqrt(g_1**2 + g_2**2 - 2*g_1*g_2*np.cos(theta_COM))
+    C_4 = -4*(1 + A**2 - 2*A*B + B**2)
+    C_3 = 4*L*(1 + A**2 - 2*A*B + B**2) - 4*(2*A*B*L - 2*L*A**2)
+    C_2 = (g_3**2 - L**2)*(1 + A**2 - 2*A*B + B**2) + 4*L*(2*A*B*L - 2*L*A**2) - 4*(A**2*L**2 - g_1**2)
+    C_1 = 4*A**2*L**3 + (g_3**2 - L**2)*(2*A*B*L - 2*L*A**2) - 4*g_1**2*L
+    C_0 = (g_3**2 - L**2)*A**2*L**2
+    coeffs = np.stack(np.broadcast_arrays(C_4, C_3, C_2, C_1, C_0), axis=-1)
+    return A, B, coeffs
+
+
+def quartic_roots(coeffs):
+    """Returns all four (complex) roots of each quartic in coeffs, which has the shape (..., 5).
+
+    The roots are the eigenvalues of the companion matrices, which np.linalg.eigvals finds for the whole stack of them
+    at once. Note that C_4 = -4*((A - B)**2 + 1) can never be zero, so the quartic never degenerates."""
+    coeffs = np.asarray(coeffs, dtype=float)
+    monic = coeffs[..., 1:] / coeffs[..., :1]
+    companion = np.zeros(coeffs.shape[:-1] + (4, 4))
+    companion[..., 0, :] = -monic
+    companion[..., 1, 0] = 1.0
+    companion[..., 2, 1] = 1.0
+    companion[..., 3, 2] = 1.0
+    return np.linalg.eigvals(companion)
+
+
+def polish_roots(coeffs, roots, n_iter=2):
+    """Refines the real roots of the quartics in coeffs with a few Newton steps, to full double precision.
+
+    coeffs has the shape (..., 5), and roots the shape (..., n), i.e. any number of candidate roots per quartic."""
+    coeffs = np.asarray(coeffs, dtype=float)[..., np.newaxis, :]
+    roots = np.array(roots, dtype=float)
+    for _ in range(n_iter):
+        p = coeffs[..., 0]
+        dp = np.zeros_like(p)
+        for k in range(1, 5):
+            dp = dp * roots + p
+            p = p * roots + coeffs[..., k]
+        # Leave any root alone where the step can't be trusted (e.g. on a double root, where dp vanishes).
+        step = np.divide(p, dp, out=np.zeros_like(roots), where=(dp != 0))
+        roots = roots - np.where(np.isfinite(step), step, 0.0)
+    return roots
+
+
+def _numpy_real_roots(coeffs):
+    roots = quartic_roots(coeffs)
+    is_real = np.abs(roots.imag) <= REAL_ROOT_RTOL * np.abs(roots)
+    return polish_roots(coeffs, roots.real[is_real])
+
+
+def _sympy_real_roots(coeffs):
+    from sympy import solve
+    from sympy.abc import l
+    from sympy.core.numbers import Float
+
+    C_4, C_3, C_2, C_1, C_0 = (float(c) for c in coeffs)
+    sols = solve(C_4*l**4 + C_3*l**3 + C_2*l**2 + C_1*l + C_0)
+    # Keep only the real solutions:
+    return np.array([float(r) for r in sols if isinstance(r, Float)])
+
+
+def random_geometries(n, rng, g_range=(10.0, 200.0), theta_COM_range=(1.6, np.pi), slack_range=(1.02, 3.0)):
+    """Draws n random, valid geometries (g_1, g_2, theta_COM, L) as arrays.
+
+    The strap length L is drawn as a multiple (slack_range) of the distance g_3 between the buttons, so that it's always
+    long enough to reach between them."""
+    g_1 = rng.uniform(*g_range, size=n)
+    g_2 = rng.uniform(*g_range, size=n)
+    theta_COM = rng.uniform(*theta_COM_range, size=n)
+    g_3 = np.sqrt(g_1**2 + g_2**2 - 2*g_1*g_2*np.cos(theta_COM))
+    L = g_3 * rng.uniform(*slack_range, size=n)
+    return g_1, g_2, theta_COM, L
+
+
+def check_backend_parity(n_samples=500, seed=0, rtol=1e-9):
+    """Solves n_samples random geometries with both backends (and the batch solvers) and checks that they agree.
+
+    Both have to agree on whether the system is stable, and if so, on all of the values in the result. The warm-started
+    batch solver is checked against the batch solver too, with the geometries arranged in two dimensions. Returns the
+    number of stable geometries that were compared, and raises an AssertionError on the first disagreement."""
+    rng = np.random.default_rng(seed)
+    n_stable = 0
+    geometries = random_geometries(n_samples, rng)
+    batch_res = gthoi_solver_batch(*geometries)
+    for g_1, g_2, theta_COM, L, row in zip(*geometries, batch_res):
+        num_res = gthoi_solver(g_1, g_2, theta_COM, L, backend='numpy')
+        sym_res = gthoi_solver(g_1, g_2, theta_COM, L, backend='sympy')
+        assert num_res.keys() == sym_res.keys(), \
+            f"Backends disagree on stability for (g_1, g_2, theta_COM, L) = {(g_1, g_2, theta_COM, L)}."
+        assert row['stable'] == bool(num_res), \
+            f"Batch and scalar solvers disagree on stability for (g_1, g_2, theta_COM, L) = {(g_1, g_2, theta_COM, L)}."
+        for key in num_res:
+            assert np.isclose(num_res[key], sym_res[key], rtol=rtol, atol=rtol * L), \
+                f"Backends disagree on {key} for (g_1, g_2, theta_COM, L) = {(g_1, g_2, theta_COM, L)}: " \
+                f"{num_res[key]} (numpy) vs. {sym_res[key]} (sympy)."
+            assert np.isclose(row[key], num_res[key], rtol=rtol, atol=rtol * L), \
+                f"Batch and scalar solvers disagree on {key} for (g_1, g_2, theta_COM, L) = " \
+                f"{(g_1, g_2, theta_COM, L)}: {row[key]} (batch) vs. {num_res[key]} (scalar)."
+        n_stable += bool(num_res)
+
+    # Warm-started from the solutions slightly scaled (as from a nearby geometry), and from a single guess for all of
+    #   them, which has to broadcast. Either way, the result keeps the shape of the geometries. (From the single guess,
+    #   the few Newton steps only get as close as the final check needs, hence the looser tolerance.)
+    m = n_samples - n_samples % 2
+    grid = tuple(x[:m].reshape(2, -1) for x in geometries)
+    grid_res = batch_res[:m].reshape(2, -1)
+    for l_guess, tol in ((grid_res['left_strap_seg_len'] * (1 + 1e-3), rtol),
+                         (float(np.median(grid[3])) / 2, RESIDUAL_RTOL)):
+        warm_res = gthoi_solver_batch_warm(*grid, l_guess)
+        assert warm_res.shape == grid_res.shape, \
+            f"The warm-started batch solver returned the shape {warm_res.shape} for {grid_res.shape} geometries."
+        assert np.array_equal(warm_res['stable'], grid_res['stable']), \
+            "The warm-started and batch solvers disagree on stability."
+        for key in ('guitar_angle', 'left_strap_seg_len', 'strap_angle'):
+            assert np.allclose(warm_res[key], grid_res[key], rtol=tol, atol=tol * np.max(grid[3]), equal_nan=True), \
+                f"The warm-started and batch solvers disagree on {key}."
+    return n_stable
+
+
 if __name__ == '__main__':
-    res = gthoi_solver(174.0028735394907, 181.99450541156455, 3.0312562559449687, 400)
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--parity', type=int, default=0, metavar='N',
+                        help="Check that the numpy and sympy backends agree on N random geometries.")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="The seed for the random geometries used by --parity.")
+    args = parser.parse_args()
+
+    for solver_backend in SOLVER_BACKENDS:
+        res = gthoi_solver(174.0028735394907, 181.99450541156455, 3.0312562559449687, 400, backend=solver_backend)
+        print(f"{solver_backend}: {res}")
+    if args.parity:
+        n_compared = check_backend_parity(args.parity, seed=args.seed)
+        print(f"Backends agree on all {args.parity} geometries ({n_compared} of them stable).")
@@ -0,0 +1,97 @@
+# NL: The inverse problem: rather than "how does the guitar hang with this strap?", it's "what strap length makes the
+#   guitar hang at this angle?". Note that there can be more than one answer, or none at all: the equilibrium angle
+#   isn't monotonic in the strap length in general, and some strap lengths give unstable designs.
+# The method is to sweep the whole valid range of strap lengths in one vectorised solve (which also gives you the full
+#   angle vs. strap length curve), bracket every crossing of the target angle in that sweep, and then close in on
+#   each crossing with the Illinois variant of regula falsi (a secant method that keeps the root bracketed). Each
+#   solve there is warm-started from the last one with gthoi_solver_warm.
+# With a shoulder of finite radius, every solve is carried over to the extended model, for the free-sliding angle (see
+#   gthoi_extended.py).
+
+import numpy as np
+
+from gthoi_extended import gthoi_solver_extended, gthoi_solver_extended_batch
+from gthoi_solver import gthoi_solver_batch, gthoi_solver_warm
+
+
+# The default range of the sweep over strap lengths is from just over the distance g_3 between the buttons (the
+#   shortest strap that reaches) up to this multiple of it.
+DEFAULT_MAX_STRAP_RATIO = 6.0
+
+# The default number of strap lengths in the sweep.
+DEFAULT_N_SWEEP = 1000
+
+# A crossing found by the root-finder only counts if its angle is within this many radians of the target. (Anything
+#   else is a jump in the curve, e.g. where the guitar flips past vertical, rather than a crossing.)
+ANGLE_TOLERANCE = 1e-6
+
+
+def strap_length_for_angle(g_1, g_2, theta_COM, target_rot, pre_rot=0.0, max_strap_ratio=DEFAULT_MAX_STRAP_RATIO,
+                           n_sweep=DEFAULT_N_SWEEP, xtol=1e-10, max_iter=100, shoulder_radius=0.0):
+    """Finds the strap lengths L for which the guitar hangs at target_rot.
+
+    g_1, g_2, theta_COM and pre_rot are as returned by gthoi_geometry.solver_inputs (with g_1 and g_2 in the units of
+    the strap length), and target_rot is a clockwise angle vs. the horizontal of the image, in radians, like total_rot.
+    Returns a dict with:
+        'strap_lengths': every strap length found that gives target_rot, in increasing order (possibly none),
+        'L_values', 'total_rot': the sweep, i.e. the angle vs. strap length curve, with NaN where it's unstable.
+    The search only covers strap lengths up to max_strap_ratio times the distance between the buttons.
+    xtol is relative to the distance between the buttons. shoulder_radius (in the units of the strap length) chooses the
+    extended model."""
+    def solve(L, l_guess):
+        # Returns the quartic's solution (which the next solve is warm-started from) and the one for the model.
+        all_res = gthoi_solver_warm(g_1, g_2, theta_COM, L, l_guess)
+        if all_res and shoulder_radius:
+            return all_res, gthoi_solver_extended(g_1, g_2, theta_COM, L, shoulder_radius, base_res=all_res)
+        return all_res, all_res
+
+    g_3 = np.sqrt(g_1**2 + g_2**2 - 2*g_1*g_2*np.cos(theta_COM))
+    L_values = np.linspace(g_3, max_strap_ratio * g_3, n_sweep + 1)[1:]
+    sweep = gthoi_solver_batch(g_1, g_2, theta_COM, L_values)
+    model_sweep = (gthoi_solver_extended_batch(g_1, g_2, theta_COM, L_values, shoulder_radius, base=sweep)
+                   if shoulder_radius else sweep)
+    total_rot = pre_rot + model_sweep['guitar_angle']
+
+    # Every pair of neighbouring (stable) strap lengths with the target angle between them brackets a crossing (which
+    #   may turn out to be a jump):
+    diff = total_rot - target_rot
+    brackets = np.flatnonzero(np.sign(diff[:-1]) * np.sign(diff[1:]) <= 0)
+
+    strap_lengths = []
+    for i in brackets:
+        L_lo, L_hi = L_values[i], L_values[i + 1]
+        f_lo, f_hi = diff[i], diff[i + 1]
+        # The left strap segment length scales more or less with L, so the last solution, scaled, is a good guess.
+        l_over_L = sweep['left_strap_seg_len'][i] / L_lo
+        L = L_lo
+        side = 0
+        for _ in range(max_iter):
+            if f_lo == 0 or f_hi == 0 or L_hi - L_lo <= xtol * g_3:
+                break
+            L = (L_lo * f_hi - L_hi * f_lo) / (f_hi - f_lo)
+            quartic_res, all_res = solve(L, l_over_L * L)
+            if not all_res:
+                break
+            l_over_L = quartic_res['left_strap_seg_len'] / L
+            f = pre_rot + all_res['guitar_angle'] - target_rot
+            # Illinois: if the same end of the bracket is kept twice running, halve the function value there, which
+            #   stops plain regula falsi from crawling in from one side.
+            if np.sign(f) == np.sign(f_hi):
+                L_hi, f_hi = L, f
+                if side == -1:
+                    f_lo /= 2
+                side = -1
+            else:
+                L_lo, f_lo = L, f
+                if side == 1:
+                    f_hi /= 2
+                side = 1
+        # Note that f_lo and f_hi may have been halved along the way, so the final check is on the solution itself.
+        L_best = L_lo if abs(f_lo) <= abs(f_hi) else L_hi
+        _, all_res = solve(L_best, l_over_L * L_best)
+        # (A crossing exactly on one of the swept strap lengths is bracketed from both sides, so it's only kept once.)
+        if (all_res and abs(pre_rot + all_res['guitar_angle'] - target_rot) <= ANGLE_TOLERANCE and
+                not (strap_lengths and L_best - strap_lengths[-1] <= xtol * g_3)):
+            strap_lengths.append(float(L_best))
+
+    return {'strap_lengths': strap_lengths, 'L_values': L_values, 'total_rot': total_rot}
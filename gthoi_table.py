@@ -0,0 +1,262 @@
+# NL: A precomputed lookup table of solutions from gthoi_solver_batch (see gthoi_solver.py), for when solving the
+#   quartic every time is still too slow, e.g. for huge sweeps.
+# The angles in the solution depend only on the dimensionless ratios g_1/L and g_2/L and on theta_COM (and the left
+#   strap segment length, divided by L, likewise), so a single 3D grid covers every guitar and strap. Queries are
+#   answered by trilinear interpolation, and each grid cell carries its own error bound, worked out when the table is
+#   built. Any query that lands outside the grid, in a cell that touches the unstable region, or in a cell whose error
+#   bound is too large is handed back to the exact solver instead.
+# Build the table by running this file. It's written as a .npy file (which is memory-mapped when it's loaded, so only
+#   the cells that are actually used are ever read in), along with a small JSON file describing the grid axes.
+
+import json
+import os
+import time
+
+import numpy as np
+
+from gthoi_solver import BATCH_RESULT_DTYPE, STATUS_OK, STATUS_RESIDUAL, gthoi_solver_batch
+
+
+DEFAULT_TABLE_PATH = 'config/gthoi_table.npy'
+
+# The ranges covered by the grid axes, in the order they're stored: g_1/L, g_2/L and theta_COM.
+DEFAULT_AXIS_RANGES = ((0.02, 1.0), (0.02, 1.0), (0.1, np.pi))
+
+# The channels stored (as float32) for each grid point. The first three are the interpolated values, and are NaN
+#   wherever the solution isn't STATUS_OK. 'cell_err' is the error bound for the cell that has this point as its lowest
+#   corner (it's inf along the far edges of the grid, where there is no such cell).
+TABLE_CHANNELS = ('guitar_angle', 'left_strap_seg_len_ratio', 'strap_angle', 'cell_err')
+
+# The default tolerance on the error bound of a cell for it to be used, in radians for the angles, and as a fraction of
+#   L for the left strap segment length.
+DEFAULT_TOLERANCE = 1e-3
+
+# The default number of grid points along each axis. The error of trilinear interpolation goes down with the square of
+#   the grid spacing.
+DEFAULT_RESOLUTION = 128
+
+# The error bounds are multiplied by this, to allow for the curvature varying over a cell.
+CELL_ERR_SAFETY_FACTOR = 1.5
+
+
+def _meta_path(path):
+    return path[:-len('.npy')] + '.json' if path.endswith('.npy') else path + '.json'
+
+
+def _solve_grid_points(axes_points, chunk_size=1 << 16):
+    """Solves gthoi_solver_batch with L = 1 for all of the points given by the axes_points, a tuple of three arrays of
+    the same shape. Returns an array of that shape, plus a final axis of the three solution values."""
+    r_1, r_2, theta_COM = (p.ravel() for p in axes_points)
+    values = np.empty((r_1.size, 3))
+    for start in range(0, r_1.size, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        res = gthoi_solver_batch(r_1[chunk], r_2[chunk], theta_COM[chunk], 1.0)
+        values[chunk, 0] = res['guitar_angle']
+        values[chunk, 1] = res['left_strap_seg_len']
+        values[chunk, 2] = res['strap_angle']
+    return values.reshape(axes_points[0].shape + (3,))
+
+
+def _cell_corners_max(point_values):
+    """The maximum of point_values (defined on the grid points) over the eight corners of each cell."""
+    n = point_values.shape[0] - 1
+    return np.max([point_values[i:n + i, j:n + j, k:n + k] for i in (0, 1) for j in (0, 1) for k in (0, 1)], axis=0)
+
+
+def build_table(path=DEFAULT_TABLE_PATH, resolution=DEFAULT_RESOLUTION, axis_ranges=DEFAULT_AXIS_RANGES):
+    """Solves the system over the whole grid, bounds the error of each cell, and writes the table out to path."""
+    axes = [np.linspace(lo, hi, resolution) for lo, hi in axis_ranges]
+    values = _solve_grid_points(np.meshgrid(*axes, indexing='ij'))
+
+    # Within a cell, the error of trilinear interpolation is at most the sum over the axes of (h**2/8)*|f''|, with h the
+    #   grid spacing along that axis. h**2*f'' is estimated by the second differences along each axis, taking the worst
+    #   over the corners of the cell.
+    curvature_bound = np.zeros((resolution - 1,) * 3 + (3,))
+    for axis in range(3):
+        second_diff = np.abs(np.diff(values, n=2, axis=axis))
+        pad = [(0, 0)] * values.ndim
+        pad[axis] = (1, 1)
+        curvature_bound += _cell_corners_max(np.pad(second_diff, pad, mode='edge')) / 8
+
+    # As a check on that, compare the exact solution at the centre of each cell with the trilinear interpolation there
+    #   (which is just the mean of the eight corners). Any NaN means the cell touches the unstable region, and it will
+    #   never be used.
+    centres = [(a[:-1] + a[1:]) / 2 for a in axes]
+    exact_centres = _solve_grid_points(np.meshgrid(*centres, indexing='ij'))
+    interp_centres = np.mean([values[i:resolution - 1 + i, j:resolution - 1 + j, k:resolution - 1 + k]
+                              for i in (0, 1) for j in (0, 1) for k in (0, 1)], axis=0)
+    cell_err = CELL_ERR_SAFETY_FACTOR * np.max(np.maximum(curvature_bound, np.abs(exact_centres - interp_centres)),
+                                               axis=-1)
+    cell_err[np.isnan(cell_err)] = np.inf
+
+    table = np.full((resolution,) * 3 + (len(TABLE_CHANNELS),), np.inf, dtype=np.float32)
+    table[..., :3] = values
+    table[:-1, :-1, :-1, 3] = cell_err
+    np.save(path, table)
+    with open(_meta_path(path), mode='w') as meta_file:
+        json.dump({'channels': TABLE_CHANNELS, 'axis_ranges': [list(r) for r in axis_ranges],
+                   'resolution': resolution}, meta_file, indent=4)
+
+
+class EquilibriumTable:
+    """A lookup table written by build_table. It isn't read from disk until it's first used."""
+
+    def __init__(self, path=DEFAULT_TABLE_PATH, tolerance=DEFAULT_TOLERANCE):
+        self.path = path
+        self.tolerance = tolerance
+        self._table = None
+        self._axis_ranges = None
+        self._axis_origins = None
+        self._axis_scales = None
+        self._values = None
+        self._corner_offsets = None
+
+    def missing_files(self):
+        """The files of the table (the .npy file, and the grid description next to it) that don't exist, e.g. because it
+        hasn't been built yet."""
+        return [path for path in (self.path, _meta_path(self.path)) if not os.path.isfile(path)]
+
+    def _load(self):
+        if self._table is None:
+            with open(_meta_path(self.path), mode='r') as meta_file:
+                meta = json.load(meta_file)
+            self._axis_ranges = np.array(meta['axis_ranges'])
+            self._table = np.load(self.path, mmap_mode='r')
+            # For solve, which works in plain Python floats: the grid axes (the start of each, and the number of cells
+            #   per unit along it), and the table as a flat sequence of floats (still memory-mapped), with the offsets
+            #   in it of the corners of a cell from its lowest corner.
+            resolution = self._table.shape[0]
+            self._axis_origins = [float(lo) for lo, _ in meta['axis_ranges']]
+            self._axis_scales = [(resolution - 1) / (hi - lo) for lo, hi in meta['axis_ranges']]
+            self._values = memoryview(np.ascontiguousarray(self._table, dtype=np.float32)).cast('B').cast('f')
+            strides = (resolution**2 * len(TABLE_CHANNELS), resolution * len(TABLE_CHANNELS), len(TABLE_CHANNELS))
+            self._corner_offsets = [i * strides[0] + j * strides[1] + k * strides[2]
+                                    for i in (0, 1) for j in (0, 1) for k in (0, 1)]
+        return self._table
+
+    def interpolate(self, g_1, g_2, theta_COM, L):
+        """Interpolates the table at the given geometries, which are broadcast together.
+
+        Returns the interpolated results as a structured array of BATCH_RESULT_DTYPE, and the error bounds of the cells
+        they came from. Queries outside the grid, or in a cell that touches the unstable region, get an error bound of
+        inf, and STATUS_RESIDUAL, as the interpolation can't be trusted there."""
+        table = self._load()
+        resolution = table.shape[0]
+        g_1, g_2, theta_COM, L = (np.asarray(x, dtype=float) for x in np.broadcast_arrays(g_1, g_2, theta_COM, L))
+        coords = np.stack((g_1 / L, g_2 / L, theta_COM), axis=-1)
+
+        # The position of each query in units of grid cells, split into the lowest corner of its cell and the
+        #   fractional position within the cell:
+        lo, hi = self._axis_ranges[:, 0], self._axis_ranges[:, 1]
+        with np.errstate(invalid='ignore'):
+            pos = (coords - lo) / (hi - lo) * (resolution - 1)
+            inside = np.all((pos >= 0) & (pos <= resolution - 1), axis=-1)
+        pos = np.where(inside[..., np.newaxis], pos, 0.0)
+        corner = np.minimum(pos.astype(np.intp), resolution - 2)
+        frac = pos - corner
+
+        interp = np.zeros(g_1.shape + (3,))
+        for i in (0, 1):
+            for j in (0, 1):
+                for k in (0, 1):
+                    weight = ((frac[..., 0] if i else 1 - frac[..., 0]) *
+                              (frac[..., 1] if j else 1 - frac[..., 1]) *
+                              (frac[..., 2] if k else 1 - frac[..., 2]))
+                    interp += weight[..., np.newaxis] * table[corner[..., 0] + i, corner[..., 1] + j,
+                                                              corner[..., 2] + k, :3]
+        err = np.where(inside, table[corner[..., 0], corner[..., 1], corner[..., 2], 3], np.inf)
+
+        result = np.empty(g_1.shape, dtype=BATCH_RESULT_DTYPE)
+        usable = np.isfinite(err)
+        result['guitar_angle'] = np.where(usable, interp[..., 0], np.nan)
+        result['left_strap_seg_len'] = np.where(usable, interp[..., 1] * L, np.nan)
+        result['strap_angle'] = np.where(usable, interp[..., 2], np.nan)
+        result['status'] = np.where(usable, STATUS_OK, STATUS_RESIDUAL)
+        result['stable'] = usable
+        return result, err
+
+    def solve_batch(self, g_1, g_2, theta_COM, L):
+        """The equivalent of gthoi_solver_batch, answering from the table wherever its error bound is within the
+        tolerance, and from gthoi_solver_batch everywhere else."""
+        result, err = self.interpolate(g_1, g_2, theta_COM, L)
+        exact = ~(err <= self.tolerance)
+        if np.any(exact):
+            g_1, g_2, theta_COM, L = np.broadcast_arrays(g_1, g_2, theta_COM, L)
+            result[exact] = gthoi_solver_batch(g_1[exact], g_2[exact], theta_COM[exact], L[exact])
+        return result
+
+    def solve(self, g_1, g_2, theta_COM, L):
+        """The equivalent of gthoi_solver, for a single geometry. As with gthoi_solver, {} means the design is
+        unstable.
+
+        This does the same as solve_batch, but reads just the one cell it needs, and in plain Python floats (as making
+        even a tiny NumPy array costs more than all the arithmetic), which keeps it down to a few microseconds when the
+        answer comes from the table."""
+        table = self._load()
+        resolution = table.shape[0]
+        g_1, g_2, theta_COM, L = float(g_1), float(g_2), float(theta_COM), float(L)
+        pos = [(x - origin) * scale
+               for x, origin, scale in zip((g_1 / L, g_2 / L, theta_COM), self._axis_origins, self._axis_scales)]
+        if all(0 <= p <= resolution - 1 for p in pos):
+            i, j, k = (min(int(p), resolution - 2) for p in pos)
+            first = ((i * resolution + j) * resolution + k) * len(TABLE_CHANNELS)
+            values = self._values
+            if values[first + 3] <= self.tolerance:
+                t_1, t_2, t_3 = pos[0] - i, pos[1] - j, pos[2] - k
+                s_1, s_2, s_3 = 1 - t_1, 1 - t_2, 1 - t_3
+                # The weights of the corners, in the order of _corner_offsets:
+                weights = (s_1*s_2*s_3, s_1*s_2*t_3, s_1*t_2*s_3, s_1*t_2*t_3,
+                           t_1*s_2*s_3, t_1*s_2*t_3, t_1*t_2*s_3, t_1*t_2*t_3)
+                guitar_angle = left_strap_seg_len_ratio = strap_angle = 0.0
+                for weight, offset in zip(weights, self._corner_offsets):
+                    corner = first + offset
+                    guitar_angle += weight * values[corner]
+                    left_strap_seg_len_ratio += weight * values[corner + 1]
+                    strap_angle += weight * values[corner + 2]
+                return {'guitar_angle': guitar_angle,
+                        'left_strap_seg_len': left_strap_seg_len_ratio * L,
+                        'strap_angle': strap_angle}
+
+        row = gthoi_solver_batch(g_1, g_2, theta_COM, L)
+        if row['status'] != STATUS_OK:
+            return {}
+        return {'guitar_angle': float(row['guitar_angle']),
+                'left_strap_seg_len': float(row['left_strap_seg_len']),
+                'strap_angle': float(row['strap_angle'])}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from gthoi_solver import random_geometries
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default=DEFAULT_TABLE_PATH,
+                        help="The path of the .npy file to write the table to. The grid description is written next to "
+                             "it, with a .json extension.")
+    parser.add_argument('--resolution', type=int, default=DEFAULT_RESOLUTION,
+                        help="The number of grid points along each axis.")
+    parser.add_argument('--check', type=int, default=100000, metavar='N',
+                        help="After building, compare the table against the exact solver on N random geometries.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build_table(args.output, resolution=args.resolution)
+    print(f"Built a {args.resolution}**3 table in {time.perf_counter() - start:.2f} s and wrote it to {args.output}.")
+
+    if args.check:
+        lookup_table = EquilibriumTable(args.output)
+        geometries = random_geometries(args.check, np.random.default_rng(0))
+        _, cell_err = lookup_table.interpolate(*geometries)
+        from_table = cell_err <= lookup_table.tolerance
+        start = time.perf_counter()
+        table_res = lookup_table.solve_batch(*geometries)
+        table_time = time.perf_counter() - start
+        start = time.perf_counter()
+        exact_res = gthoi_solver_batch(*geometries)
+        exact_time = time.perf_counter() - start
+        assert np.array_equal(table_res['stable'], exact_res['stable'])
+        max_err = np.max(np.abs(table_res['guitar_angle'] - exact_res['guitar_angle'])[from_table], initial=0.0)
+        print(f"{np.count_nonzero(from_table)} of {args.check} random geometries were answered from the table, and the "
+              f"rest by the exact solver. The largest error in guitar_angle was {max_err:.2e} rad.")
+        print(f"That took {table_time:.3f} s, vs. {exact_time:.3f} s for the exact solver alone.")
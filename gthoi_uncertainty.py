@@ -0,0 +1,195 @@
+# NL: How much to trust the equilibrium angle, given that the inputs are only measured to within a centimetre or so.
+#   Each of the marker positions (B1, COM and B2) and the strap length is given an uncertainty (a standard deviation, in
+#   the units of the strap length, and for each of the x and y coordinates of the markers), and that is propagated
+#   through the solver two ways:
+# - by Monte Carlo: a large sample of perturbed inputs is solved in one go, giving the distribution of the equilibrium
+#   angle, and the probability that the design is actually unstable (or that the strap doesn't reach). The samples are
+#   all close to the measured inputs, so they're solved by gthoi_solver_batch_warm, warm-started from the solution for
+#   those, which is what keeps 100k samples well under a second.
+# - to first order: the analytic gradient of the angle with respect to each input (from gthoi_solver_gradient), which
+#   also shows which measurement matters most.
+# With a shoulder of finite radius, both are for the free-sliding angle of the extended model (see gthoi_extended.py):
+#   the samples are carried over to it from the quartic's solutions, and its gradient is found numerically.
+# Run this file for a config file, e.g.
+#   python gthoi_uncertainty.py config/config.json --uncertainties 1 1 1 0.5
+# or press 'u' in get_the_hang_of_it.py for the markers where they are.
+
+import argparse
+import json
+
+import numpy as np
+
+from gthoi_extended import gthoi_solver_extended_batch, gthoi_solver_extended_gradient
+from gthoi_geometry import (config_extended_model, config_marker_centres, config_real_to_pixel_dist_ratio, equilibrium,
+                            solver_inputs)
+from gthoi_solver import STATUS_INVALID, STATUS_OK, gthoi_solver_batch_warm, gthoi_solver_gradient
+
+
+# The inputs that have an uncertainty, in the order they're given.
+UNCERTAIN_INPUTS = ('B1', 'COM', 'B2', 'strap_length')
+
+# The default uncertainty of each input, in the units of the strap length.
+DEFAULT_UNCERTAINTIES = (1.0, 1.0, 1.0, 1.0)
+
+DEFAULT_N_SAMPLES = 100000
+
+# The percentiles of the equilibrium angle that are reported.
+PERCENTILES = (2.5, 25.0, 50.0, 75.0, 97.5)
+
+# The number of bins in the histogram of the equilibrium angle.
+HISTOGRAM_BINS = 40
+
+
+def _angle_gradient(v, g):
+    """The derivative of the direction of the vectors v (y up) with respect to them, and of their lengths g."""
+    return np.stack([-v[..., 1], v[..., 0]], axis=-1) / g[..., np.newaxis]**2, v / g[..., np.newaxis]
+
+
+def equilibrium_gradient(B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length, all_res,
+                         shoulder_radius=0.0):
+    """Returns the derivatives of the equilibrium angle (total_rot) at all_res (a result from equilibrium(), with the
+    same shoulder_radius) with respect to each of UNCERTAIN_INPUTS: for each marker, an array of the derivatives by its
+    x and y coordinates in the image (in the real units of length, with y pointing down the image, as for the pixels),
+    and a number for the strap length."""
+    g_1, g_2, theta_COM, pre_rot, B1_is_left = solver_inputs(B1_centre, COM_centre, B2_centre)
+    g_1, g_2 = g_1 * real_to_pixel_dist_ratio, g_2 * real_to_pixel_dist_ratio
+    if shoulder_radius:
+        d_rot = gthoi_solver_extended_gradient(g_1, g_2, theta_COM, strap_length, shoulder_radius)
+    else:
+        d_rot = gthoi_solver_gradient(g_1, g_2, theta_COM, strap_length, all_res['guitar_angle'],
+                                      all_res['left_strap_seg_len'], all_res['strap_angle'])[0]
+    d_g_1, d_g_2, d_theta_COM, d_L = d_rot
+
+    # Vectors from the COM to the left and right buttons, in real units, with y pointing up (see solver_inputs). With
+    #   alpha the direction of a vector, theta_COM = alpha(v_left) - alpha(v_right) and pre_rot = alpha(v_left) - pi,
+    #   and total_rot = pre_rot + guitar_angle.
+    B_left, B_right = (B1_centre, B2_centre) if B1_is_left else (B2_centre, B1_centre)
+    flip_y = np.array([1.0, -1.0])
+    v_left, v_right = ((np.asarray(B, dtype=float) - np.asarray(COM_centre, dtype=float)) * flip_y *
+                       real_to_pixel_dist_ratio for B in (B_left, B_right))
+    d_alpha_left, d_g_left = _angle_gradient(v_left, g_1)
+    d_alpha_right, d_g_right = _angle_gradient(v_right, g_2)
+    grad_left = d_alpha_left * (1 + d_theta_COM) + d_g_left * d_g_1
+    grad_right = -d_alpha_right * d_theta_COM + d_g_right * d_g_2
+
+    # Back to y pointing down the image:
+    grad_B1, grad_B2 = (grad_left, grad_right) if B1_is_left else (grad_right, grad_left)
+    return {'B1': grad_B1 * flip_y, 'COM': -(grad_left + grad_right) * flip_y, 'B2': grad_B2 * flip_y,
+            'strap_length': float(d_L)}
+
+
+def equilibrium_uncertainty(B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length,
+                            uncertainties=DEFAULT_UNCERTAINTIES, n_samples=DEFAULT_N_SAMPLES, seed=None,
+                            shoulder_radius=0.0):
+    """Propagates the uncertainties (standard deviations of each of UNCERTAIN_INPUTS, in the real units of length) in
+    the inputs to equilibrium() through to the equilibrium angle. The marker centres are in pixels, as for
+    equilibrium(), and shoulder_radius (which is taken as exact) chooses the extended model, as there.
+
+    Returns a dict with:
+        'nominal_rot': the equilibrium angle for the inputs as given (None if that's unstable),
+        'n_samples', 'p_unstable', 'p_strap_too_short': the Monte Carlo sample size, and the fractions of the sample
+            that were unstable designs, and that had a strap too short to reach between the buttons,
+        'mean', 'std', 'percentiles' (a dict by PERCENTILES), 'histogram_edges', 'histogram_counts': the distribution
+            of the equilibrium angle over the stable part of the sample,
+        'gradient': as from equilibrium_gradient (None if the nominal design is unstable),
+        'linear_std': the standard deviation of the angle to first order, from the gradient (likewise None).
+    All of the angles are in radians, as total_rot. The ones from the sample are None if none of it was stable."""
+    rng = np.random.default_rng(seed)
+    sigma = dict(zip(UNCERTAIN_INPUTS, uncertainties))
+    centres = {'B1': B1_centre, 'COM': COM_centre, 'B2': B2_centre}
+    nominal = equilibrium(B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length,
+                          shoulder_radius=shoulder_radius)
+
+    # The marker positions are perturbed in pixels, so their uncertainties are converted from real units:
+    samples = {name: np.asarray(centre, dtype=float) +
+               rng.normal(0.0, sigma[name] / real_to_pixel_dist_ratio, size=(n_samples, 2))
+               for name, centre in centres.items()}
+    L = strap_length + rng.normal(0.0, sigma['strap_length'], size=n_samples)
+    g_1, g_2, theta_COM, pre_rot, _ = solver_inputs(samples['B1'], samples['COM'], samples['B2'])
+    # Every sample is warm-started from the nominal solution, scaled with the strap length. (If the nominal design is
+    #   unstable, half the strap length is as good a guess as any: rows that don't converge are solved exactly.)
+    #   The extended model's left_strap_seg_len stops short of where the quartic's does, but it's just as good a guess.
+    l_ratio = nominal['left_strap_seg_len'] / strap_length if nominal else 0.5
+    g_1, g_2 = g_1 * real_to_pixel_dist_ratio, g_2 * real_to_pixel_dist_ratio
+    res = gthoi_solver_batch_warm(g_1, g_2, theta_COM, L, l_ratio * L)
+    if shoulder_radius:
+        res = gthoi_solver_extended_batch(g_1, g_2, theta_COM, L, shoulder_radius, base=res)
+
+    stable = res['status'] == STATUS_OK
+    total_rot = pre_rot[stable] + res['guitar_angle'][stable]
+    results = {'nominal_rot': float(nominal['total_rot']) if nominal else None,
+               'n_samples': n_samples,
+               'p_unstable': float(np.mean(~stable & (res['status'] != STATUS_INVALID))),
+               'p_strap_too_short': float(np.mean(res['status'] == STATUS_INVALID)),
+               'mean': None, 'std': None, 'percentiles': None, 'histogram_edges': None, 'histogram_counts': None,
+               'gradient': None, 'linear_std': None}
+    if total_rot.size:
+        counts, edges = np.histogram(total_rot, bins=HISTOGRAM_BINS)
+        results.update({'mean': float(np.mean(total_rot)),
+                        'std': float(np.std(total_rot)),
+                        'percentiles': dict(zip(PERCENTILES, np.percentile(total_rot, PERCENTILES).tolist())),
+                        'histogram_edges': edges.tolist(),
+                        'histogram_counts': counts.tolist()})
+    if nominal:
+        gradient = equilibrium_gradient(B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length,
+                                        nominal, shoulder_radius)
+        # Each coordinate of each marker is perturbed independently, so the variances just add up.
+        variance = sum(sigma[name]**2 * np.sum(np.square(gradient[name])) for name in UNCERTAIN_INPUTS)
+        results['gradient'] = {name: (grad.tolist() if name != 'strap_length' else grad)
+                               for name, grad in gradient.items()}
+        results['linear_std'] = float(np.sqrt(variance))
+    return results
+
+
+def uncertainty_report(results, uncertainties=DEFAULT_UNCERTAINTIES):
+    """Returns the results of equilibrium_uncertainty as readable text, with the angles in degrees."""
+    deg = 180 / np.pi
+    inputs = ", ".join(f"{name} {sigma:g}" for name, sigma in zip(UNCERTAIN_INPUTS, uncertainties))
+    lines = [f"With uncertainties (standard deviations, in the units of the strap length) of {inputs}:"]
+    if results['nominal_rot'] is None:
+        lines.append("  The design as measured is unstable.")
+    else:
+        lines.append(f"  The equilibrium angle as measured is {results['nominal_rot'] * deg:.2f} degrees clockwise vs. "
+                     f"the horizontal.")
+    lines.append(f"  Of {results['n_samples']} samples, {100 * results['p_unstable']:.2f}% are unstable designs, and "
+                 f"{100 * results['p_strap_too_short']:.2f}% have a strap too short to reach between the buttons.")
+    if results['mean'] is not None:
+        percentiles = ", ".join(f"{p:g}%: {v * deg:.2f}" for p, v in results['percentiles'].items())
+        lines.append(f"  Over the stable samples, the angle is {results['mean'] * deg:.2f} +/- "
+                     f"{results['std'] * deg:.2f} degrees (percentiles {percentiles}).")
+    if results['gradient'] is not None:
+        lines.append(f"  To first order, the angle is +/- {results['linear_std'] * deg:.2f} degrees. Its sensitivity "
+                     f"to each input, in degrees per unit of length:")
+        for name in UNCERTAIN_INPUTS[:3]:
+            d_x, d_y = results['gradient'][name]
+            lines.append(f"    {name}: {d_x * deg:+.3f} (x), {d_y * deg:+.3f} (y, down the image)")
+        lines.append(f"    strap_length: {results['gradient']['strap_length'] * deg:+.3f}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config_file', nargs='?', default='config/config.json',
+                        help="The config file to take the marker positions, length calibration and strap length from.")
+    parser.add_argument('--uncertainties', type=float, nargs=4, default=DEFAULT_UNCERTAINTIES,
+                        metavar=tuple(name.upper() for name in UNCERTAIN_INPUTS),
+                        help="The standard deviations of the position of each marker (in each of x and y) and of the "
+                             "strap length, in the units of the strap length.")
+    parser.add_argument('--samples', type=int, default=DEFAULT_N_SAMPLES,
+                        help="The number of Monte Carlo samples.")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="The seed for the Monte Carlo samples.")
+    parser.add_argument('--output', default=None,
+                        help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    with open(args.config_file, mode="r") as config_file:
+        configs = json.load(config_file)
+    res = equilibrium_uncertainty(*config_marker_centres(configs), config_real_to_pixel_dist_ratio(configs),
+                                  configs['init_strap_length'], uncertainties=args.uncertainties,
+                                  n_samples=args.samples, seed=args.seed,
+                                  shoulder_radius=config_extended_model(configs)[0])
+    print(uncertainty_report(res, args.uncertainties))
+    if args.output:
+        with open(args.output, mode="w") as output_file:
+            json.dump(res, output_file, indent=4)
@@ -0,0 +1,167 @@
+# NL: Solves for the 'h' key in get_the_hang_of_it.py in the background, so that the window keeps responding however
+#   long a solve takes (e.g. with the SymPy backend, which also has to be imported the first time). The main loop hands
+#   each solve to a SolveWorker with request(), and picks the result up with poll() once it's done, a frame or more
+#   later.
+# Only the latest request matters. A solve can't be stopped once it's started, so a SolveWorker only ever runs one at a
+#   time, and holds on to just the latest request that's come in since (e.g. because a marker has been moved again
+#   every frame), to start as soon as it's free. The result of a solve that's been overtaken like that is thrown away.
+#   So however many requests there are while a slow solve is running, the answer for the latest one is at most two
+#   solves away.
+# The 'a' and 'u' keys are run in the background in the same way, by a TaskWorker, except that every job handed to it
+#   is seen through, one at a time, in the order they came in.
+# The worker is a thread rather than a process, as a process would have to start the main script over again on some
+#   platforms (and import SymPy again). A NumPy solve is over in well under a millisecond anyway, and while a SymPy
+#   solve holds the GIL, Python still switches between the threads every few milliseconds, so the window keeps up.
+# Nothing here depends on pygame.
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from gthoi_geometry import button_distance, equilibrium
+
+
+def solve_message(B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length, backend='numpy',
+                  shoulder_radius=0.0, strap_friction=0.0):
+    """Solves the system for the 'h' key (the marker centres are in pixels), with the extended model if shoulder_radius
+    or strap_friction isn't 0. Returns the message to print, and the result of equilibrium(), or None if the strap is
+    too short to reach between the buttons."""
+    # Before anything else, we'll check that the user hasn't specified a strap length that's shorter than the distance
+    #   between the strap buttons (a constraint violation). This is a specific case that we can warn about directly,
+    #   rather than just having the solver say that the system is unstable.
+    # Take the distance between the strap buttons:
+    g3 = button_distance(B1_centre, B2_centre, real_to_pixel_dist_ratio)
+    if g3 > strap_length:
+        return (f"The strap length of {strap_length:.4f} is shorter than the distance between the buttons of "
+                f"{g3:.4f}. Move the buttons and/or increase the strap length and try again."), None
+    # See gthoi_geometry.py for how the marker positions are turned into the inputs to the solver.
+    all_res = equilibrium(B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length, backend=backend,
+                          shoulder_radius=shoulder_radius, strap_friction=strap_friction)
+    if not all_res:
+        return "Unstable design. Not recommended.", all_res
+    total_rot = all_res['total_rot']
+    message = f"Equilibrium angle is {total_rot * 180 / np.pi:.2f} degrees clockwise vs. the horizontal."
+    if strap_friction:
+        message += f" With friction, it can hang anywhere from {range_text(all_res)}."
+    return message, all_res
+
+
+def range_text(all_res):
+    """The range of angles that friction can hold the guitar at, as "<low> degrees to <high> degrees", for a result of
+    equilibrium() with the extended model."""
+    # An end that can't be found (see gthoi_extended.EXTENDED_RESULT_DTYPE) is most likely at vertical.
+    low, high = (f"{rot * 180 / np.pi:.2f} degrees" if np.isfinite(rot) else "vertical"
+                 for rot in all_res['total_rot_range'])
+    return f"{low} to {high}"
+
+
+def _timed_solve_message(*args, **kwargs):
+    start = time.perf_counter()
+    return solve_message(*args, **kwargs), time.perf_counter() - start
+
+
+class SolveWorker:
+    """Runs solve_message in the background for the latest request only. The time taken by each solve whose result is
+    picked up is appended to solve_times (in seconds)."""
+
+    def __init__(self, backend='numpy'):
+        self.backend = backend
+        self.solve_times = []
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # The latest request (None once its result has been picked up, or it's been cancelled), and the solve that was
+        #   started last, which is for an earlier request if that request has been overtaken since.
+        self._setup = None
+        self._future = None
+        self._future_setup = None
+
+    def _start_latest(self):
+        """Starts solving for the latest request, if it isn't already, and the previous solve has finished."""
+        if self._setup is None or self._setup == self._future_setup:
+            return
+        if self._future is None or self._future.done():
+            self._future_setup = self._setup
+            self._future = self._executor.submit(_timed_solve_message, *self._setup[:5], backend=self.backend,
+                                                 shoulder_radius=self._setup[5], strap_friction=self._setup[6])
+
+    def request(self, B1_centre, COM_centre, B2_centre, real_to_pixel_dist_ratio, strap_length, shoulder_radius=0.0,
+                strap_friction=0.0):
+        """Solves for this setup, unless it's the latest request already, in place of any earlier request that hasn't
+        been picked up. The solve starts straight away if nothing is running, and otherwise as soon as the running solve
+        is done. Returns True if it's a new request."""
+        setup = (tuple(B1_centre), tuple(COM_centre), tuple(B2_centre), real_to_pixel_dist_ratio, strap_length,
+                 shoulder_radius, strap_friction)
+        if setup == self._setup:
+            return False
+        self._setup = setup
+        self._start_latest()
+        return True
+
+    def poll(self):
+        """Returns (message, all_res, setup) as soon as the latest request has finished, once, and None otherwise. setup
+        is the arguments that were given to request(). An exception in the solve is raised here."""
+        self._start_latest()
+        if self._setup is None or self._setup != self._future_setup or not self._future.done():
+            return None
+        future, setup = self._future, self._setup
+        self._future = None
+        self._future_setup = None
+        self._setup = None
+        (message, all_res), seconds = future.result()
+        self.solve_times.append(seconds)
+        return message, all_res, setup
+
+    def wait(self):
+        """Waits for the latest request to finish, if there is one (after any overtaken solve that's still running)."""
+        while self._setup is not None:
+            self._start_latest()
+            wait([self._future])
+            if self._setup == self._future_setup:
+                return
+
+    def is_busy(self):
+        return self._setup is not None
+
+    def cancel(self):
+        """Forgets the latest request. If its solve has already started, it's left to finish, and its result is ignored
+        unless the same setup is requested again."""
+        self._setup = None
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class TaskWorker:
+    """Runs jobs in the background one at a time, in the order they're submitted, and hands their results back in the
+    same order."""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._jobs = deque()
+
+    def submit(self, tag, function, *args, **kwargs):
+        """Runs function(*args, **kwargs) once every job submitted before it has finished. tag is anything that the
+        caller needs to make sense of the result, and is handed back with it."""
+        self._jobs.append((tag, self._executor.submit(function, *args, **kwargs)))
+
+    def poll(self):
+        """Returns (tag, result) for the earliest job as soon as it's finished, once, and None otherwise. An exception
+        in the job is raised here."""
+        if not self._jobs or not self._jobs[0][1].done():
+            return None
+        tag, future = self._jobs.popleft()
+        return tag, future.result()
+
+    def wait(self):
+        """Waits for the earliest job to finish, if there is one."""
+        if self._jobs:
+            wait([self._jobs[0][1]])
+
+    def is_busy(self):
+        return bool(self._jobs)
+
+    def shutdown(self):
+        self._jobs.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)